@@ -0,0 +1,340 @@
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock, local
+from . import payloads
+
+# (path pattern, seconds). First match wins; rosters change rarely,
+# submissions change all day.
+DEFAULT_TTLS = [
+    (re.compile(r"/submissions$"), 120),
+    (re.compile(r"/assignments$"), 30 * 60),
+    (re.compile(r"/users$"), 6 * 60 * 60),
+    (re.compile(r"/courses/[^/]+$"), 6 * 60 * 60),
+]
+DEFAULT_TTL = 5 * 60
+
+
+def token_id(token):
+    """Short, non-reversible identity for an API token, safe to use in cache keys."""
+    return hashlib.sha256(str(token).encode()).hexdigest()[:16]
+
+
+def make_key(token, url, params=None):
+    items = []
+    for k, v in sorted((params or {}).items()):
+        items.append((k, tuple(v) if isinstance(v, (list, tuple)) else v))
+    return (token_id(token), url, tuple(items))
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache for decoded Canvas responses, bounded by entry
+    count and approximate size in bytes, with a TTL chosen per endpoint.
+    Keys come from make_key(), so one token never sees another's data.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=50 * 1024 * 1024, ttls=None, default_ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def ttl_for(self, url):
+        path = url.split("?", 1)[0]
+        for pattern, ttl in self.ttls:
+            if pattern.search(path):
+                return ttl
+        return self.default_ttl
+
+    def get(self, key):
+        """Return (True, value) on a fresh hit, otherwise (False, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            expires_at, size, value = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl_for(key[1])
+        size = len(payloads.dumps(value))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, size, value)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, token=None):
+        """Drop every entry, or only those cached for the given token."""
+        with self._lock:
+            if token is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            tid = token_id(token)
+            for key in [k for k in self._entries if k[0] == tid]:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+class _SqliteStore(ABC):
+    """Per-thread SQLite connections to one file, with the schema created once."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = local()
+        self._ready = False
+        self._ready_lock = Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        if not self._ready:
+            with self._ready_lock:
+                if not self._ready:
+                    self._setup(conn)
+                    self._ready = True
+        return conn
+
+    @abstractmethod
+    def _setup(self, conn):
+        """Create tables (and do any one-off cleanup) on the first connection."""
+
+
+class HttpCache(_SqliteStore):
+    """
+    On-disk store of raw GET responses with their ETag / Last-Modified
+    validators, kept in a small SQLite file. Entries survive restarts and
+    are revalidated with conditional requests instead of refetched.
+    """
+
+    def __init__(self, path, max_age_days=14):
+        super().__init__(path)
+        self.max_age = max_age_days * 24 * 60 * 60
+
+    def _setup(self, conn):
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    token_id TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    links TEXT,
+                    body BLOB NOT NULL,
+                    stored_at REAL NOT NULL,
+                    PRIMARY KEY (token_id, url)
+                )
+                """
+            )
+            conn.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.max_age,))
+
+    def get(self, token, url):
+        """Return a dict with etag, last_modified, links and body, or None."""
+        row = self._conn().execute(
+            "SELECT etag, last_modified, links, body FROM responses WHERE token_id = ? AND url = ?",
+            (token_id(token), url),
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, links, body = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "links": json.loads(links) if links else {},
+            "body": body,
+        }
+
+    def set(self, token, url, etag, last_modified, links, body):
+        if not etag and not last_modified:
+            return
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (token_id(token), url, etag, last_modified, json.dumps(links), body, time.time()),
+            )
+
+    def touch(self, token, url):
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE responses SET stored_at = ? WHERE token_id = ? AND url = ?",
+                (time.time(), token_id(token), url),
+            )
+
+    def invalidate(self, token=None):
+        with self._conn() as conn:
+            if token is None:
+                conn.execute("DELETE FROM responses")
+            else:
+                conn.execute("DELETE FROM responses WHERE token_id = ?", (token_id(token),))
+
+
+class SubmissionStore(_SqliteStore):
+    """
+    Local copy of submissions for the assignments of a course that have
+    been seeded, kept per token, plus the time the course was last synced.
+    Lets callers pull only what changed since.
+    """
+
+    def _setup(self, conn):
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS submissions (
+                    token_id TEXT NOT NULL,
+                    course_id TEXT NOT NULL,
+                    assignment_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    PRIMARY KEY (token_id, course_id, assignment_id, user_id)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS syncs (
+                    token_id TEXT NOT NULL,
+                    course_id TEXT NOT NULL,
+                    synced_at TEXT NOT NULL,
+                    full_synced_at REAL NOT NULL,
+                    PRIMARY KEY (token_id, course_id)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS seeded (
+                    token_id TEXT NOT NULL,
+                    course_id TEXT NOT NULL,
+                    assignment_id TEXT NOT NULL,
+                    PRIMARY KEY (token_id, course_id, assignment_id)
+                )
+                """
+            )
+
+    def last_sync(self, token, course_id):
+        """Return (synced_at ISO string, full_synced_at epoch), or None."""
+        return self._conn().execute(
+            "SELECT synced_at, full_synced_at FROM syncs WHERE token_id = ? AND course_id = ?",
+            (token_id(token), str(course_id)),
+        ).fetchone()
+
+    def seeded(self, token, course_id):
+        """Return the set of assignment IDs whose submissions are stored in full."""
+        rows = self._conn().execute(
+            "SELECT assignment_id FROM seeded WHERE token_id = ? AND course_id = ?",
+            (token_id(token), str(course_id)),
+        )
+        return {aid for aid, in rows}
+
+    def save(self, token, course_id, submissions, synced_at, seeded=(), full=False):
+        """
+        Upsert submissions and record the sync. Assignments in seeded were
+        fetched in full and replace what was stored for them; a full sync
+        replaces the course.
+        """
+        tid = token_id(token)
+        cid = str(course_id)
+        seeded = [str(aid) for aid in seeded]
+        rows = [
+            (tid, cid, str(sub.get("assignment_id")), str(sub.get("user_id")), payloads.dumps(sub))
+            for sub in submissions
+        ]
+        with self._conn() as conn:
+            if full:
+                conn.execute("DELETE FROM submissions WHERE token_id = ? AND course_id = ?", (tid, cid))
+                conn.execute("DELETE FROM seeded WHERE token_id = ? AND course_id = ?", (tid, cid))
+            else:
+                conn.executemany(
+                    "DELETE FROM submissions WHERE token_id = ? AND course_id = ? AND assignment_id = ?",
+                    [(tid, cid, aid) for aid in seeded],
+                )
+            conn.executemany("INSERT OR REPLACE INTO submissions VALUES (?, ?, ?, ?, ?)", rows)
+            conn.executemany(
+                "INSERT OR REPLACE INTO seeded VALUES (?, ?, ?)",
+                [(tid, cid, aid) for aid in seeded],
+            )
+            if full:
+                conn.execute(
+                    "INSERT OR REPLACE INTO syncs VALUES (?, ?, ?, ?)",
+                    (tid, cid, synced_at, time.time()),
+                )
+            else:
+                conn.execute(
+                    "UPDATE syncs SET synced_at = ? WHERE token_id = ? AND course_id = ?",
+                    (synced_at, tid, cid),
+                )
+
+    def load(self, token, course_id, assignment_ids):
+        """Return {assignment_id: [submissions]} for the given assignments."""
+        submissions = {str(aid): [] for aid in assignment_ids}
+        rows = self._conn().execute(
+            "SELECT assignment_id, body FROM submissions WHERE token_id = ? AND course_id = ?",
+            (token_id(token), str(course_id)),
+        )
+        for aid, body in rows:
+            if aid in submissions:
+                submissions[aid].append(payloads.loads(body))
+        return submissions
+
+    def invalidate(self, token=None):
+        with self._conn() as conn:
+            if token is None:
+                conn.execute("DELETE FROM submissions")
+                conn.execute("DELETE FROM syncs")
+                conn.execute("DELETE FROM seeded")
+            else:
+                tid = token_id(token)
+                conn.execute("DELETE FROM submissions WHERE token_id = ?", (tid,))
+                conn.execute("DELETE FROM syncs WHERE token_id = ?", (tid,))
+                conn.execute("DELETE FROM seeded WHERE token_id = ?", (tid,))
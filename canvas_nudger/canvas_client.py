@@ -1,9 +1,63 @@
-from datetime import datetime
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+from threading import Lock
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from pytz import utc
 import requests
+from requests.adapters import HTTPAdapter
+from asgiref.sync import sync_to_async
+from .cache import HttpCache, ResponseCache, SubmissionStore, make_key
+from .dates import ingest_dates, to_epoch
+from . import metrics, payloads
 
-# Simple API cache to reduce duplicate calls
-_api_cache = {}
+# Bounded TTL/LRU cache to reduce duplicate calls
+_api_cache = ResponseCache()
+
+# On-disk responses with ETag/Last-Modified, revalidated across restarts
+HTTP_CACHE_FILE = Path(__file__).resolve().parent / ".env" / "http_cache.sqlite3"
+_http_cache = HttpCache(HTTP_CACHE_FILE)
+
+# Local submission store for incremental sync (submitted_since/graded_since)
+SUBMISSIONS_FILE = Path(__file__).resolve().parent / ".env" / "submissions.sqlite3"
+_submission_store = SubmissionStore(SUBMISSIONS_FILE)
+
+# Pull only changed submissions between full syncs of a course
+INCREMENTAL_SYNC = True
+
+# Resync a course from scratch after this long
+FULL_SYNC_MAX_AGE = 24 * 60 * 60
+
+# Courses fetched in parallel by fetch_course_data
+COURSE_WORKERS = 4
+
+# Connection pool size for each Canvas session. Keep this at least
+# COURSE_WORKERS * PAGE_WORKERS so parallel fetches reuse connections.
+POOL_MAXSIZE = 16
+
+# Date fields parsed once at ingest (see dates.ingest_dates)
+COURSE_DATE_FIELDS = ("start_at", "end_at")
+ASSIGNMENT_DATE_FIELDS = ("due_at", "lock_at")
+
+# Canvas caps per_page at 100 for most list endpoints
+PAGE_SIZE = 100
+
+# Max assignment_ids[] per bulk submissions request
+SUBMISSION_BATCH_SIZE = 50
+
+# How many pages to fetch at once when Canvas tells us the last page
+PAGE_WORKERS = 4
+
+# Default (connect, read) timeout in seconds for Canvas calls, so a
+# stalled connection fails and can be retried instead of hanging
+TIMEOUT = (10, 60)
+
+# One pooled, keep-alive session per (base_url, token)
+_sessions = {}
+_sessions_lock = Lock()
 
 def has_timezone(date_obj):
     return date_obj.tzinfo is not None and date_obj.tzinfo.utcoffset(date_obj) is not None
@@ -11,40 +65,213 @@ def has_timezone(date_obj):
 def _headers(token):
     return {"Authorization": f"Bearer {token}"}
 
-def cached_get(url, headers, params=None):
-    key = (url, tuple(sorted((params or {}).items())))
-    if key in _api_cache:
-        return _api_cache[key]
+# ------------------------------------------------------------
+# HTTP transport
+# ------------------------------------------------------------
+class _TimeoutAdapter(HTTPAdapter):
+    """HTTPAdapter that applies TIMEOUT to calls made without one."""
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = TIMEOUT
+        return super().send(request, **kwargs)
 
-    resp = requests.get(url, headers=headers, params=params)
-    resp.raise_for_status()
-    data = resp.json()
-    _api_cache[key] = data
+def get_session(base_url, token, pool_maxsize=None):
+    """
+    Return the shared requests.Session for this Canvas host and token.
+    Connections are kept alive and reused, so the TCP/TLS handshake
+    is paid once per host instead of once per call.
+    """
+    key = (base_url, token)
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            size = pool_maxsize or POOL_MAXSIZE
+            adapter = _TimeoutAdapter(pool_connections=1, pool_maxsize=size)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(_headers(token))
+            session.headers.update({
+                "Accept-Encoding": "gzip, deflate",
+                "Connection": "keep-alive",
+            })
+            # Count every Canvas call (see metrics.py)
+            session.hooks["response"].append(metrics.response_hook)
+            _sessions[key] = session
+    return session
+
+def close_sessions():
+    """Close every pooled session (e.g. on shutdown or token change)."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+def cached_get(base_url, token, url, params=None, paginated=False, ingest=None):
+    """
+    GET (all pages of) url through the response cache. ingest, if given,
+    is applied to each record once before it is cached.
+    """
+    key = make_key(token, url, params)
+    hit, data = _api_cache.get(key)
+    metrics.record_cache(hit)
+    if hit:
+        return data
+
+    if paginated:
+        data = get_all(base_url, token, url, params)
+    else:
+        data, _ = _get_page(get_session(base_url, token), token, url, params)
+    if ingest:
+        for record in (data if isinstance(data, list) else [data]):
+            ingest(record)
+    _api_cache.set(key, data)
     return data
 
+def invalidate_cache(token=None):
+    """
+    Forget in-memory responses and synced submissions for one token, or for
+    everyone, so the next fetch does a full submission sync. The disk HTTP
+    cache is kept, so everything else revalidates instead of refetching.
+    """
+    _api_cache.invalidate(token)
+    _submission_store.invalidate(token)
+
+def cache_stats():
+    return _api_cache.stats()
+
+# ------------------------------------------------------------
+# Pagination (Link: rel="next" / rel="last")
+# ------------------------------------------------------------
+def _get_page(session, token, url, params=None, conditional=True):
+    """
+    GET one page and return (data, links). A copy stored on disk is
+    revalidated with If-None-Match / If-Modified-Since, and reused when
+    Canvas answers 304 Not Modified. Pass conditional=False for one-off
+    URLs that are not worth keeping on disk.
+    """
+    full_url = requests.Request("GET", url, params=params).prepare().url
+    stored = _http_cache.get(token, full_url) if conditional else None
+
+    headers = {}
+    if stored:
+        if stored["etag"]:
+            headers["If-None-Match"] = stored["etag"]
+        if stored["last_modified"]:
+            headers["If-Modified-Since"] = stored["last_modified"]
+
+    resp = session.get(full_url, headers=headers)
+    if stored and resp.status_code == 304:
+        _http_cache.touch(token, full_url)
+        return payloads.decode(full_url, stored["body"]), stored["links"]
+
+    resp.raise_for_status()
+    # Decode once and drop the fields nothing reads (see payloads.PROJECTIONS)
+    data = payloads.decode(full_url, resp.content)
+    if not conditional:
+        return data, resp.links
+
+    fields = payloads.fields_for(full_url)
+    _http_cache.set(
+        token,
+        full_url,
+        resp.headers.get("ETag"),
+        resp.headers.get("Last-Modified"),
+        resp.links,
+        resp.content if fields is None else payloads.dumps(data).encode(),
+    )
+    return data, resp.links
+
+def _link(links, rel):
+    return links.get(rel, {}).get("url")
+
+def _page_number(url):
+    """Return the numeric ?page= of a Link URL, or None for bookmark pages."""
+    if not url:
+        return None
+    page = dict(parse_qsl(urlsplit(url).query)).get("page")
+    return int(page) if page and page.isdigit() else None
+
+def _with_page(url, page):
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "page"]
+    query.append(("page", str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+def iter_pages(base_url, token, url, params=None, max_workers=None, conditional=True):
+    """
+    Yield each page of a Canvas list endpoint as a list of records.
+
+    Follows Link rel="next" headers one page at a time. When Canvas also
+    sends a numbered rel="last" link, the remaining pages are fetched
+    concurrently with at most max_workers requests in flight, and are
+    still yielded in order. Only those in-flight pages are held in memory.
+    """
+    session = get_session(base_url, token)
+    workers = max_workers or PAGE_WORKERS
+
+    data, links = _get_page(session, token, url, params, conditional)
+    yield data
+
+    next_url = _link(links, "next")
+    first = _page_number(next_url)
+    last = _page_number(_link(links, "last"))
+
+    if workers > 1 and first and last and last >= first:
+        get_page = metrics.bind(_get_page)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()
+            for page in range(first, last + 1):
+                in_flight.append(pool.submit(
+                    get_page, session, token, _with_page(next_url, page), None, conditional
+                ))
+                if len(in_flight) >= workers:
+                    yield in_flight.popleft().result()[0]
+            while in_flight:
+                yield in_flight.popleft().result()[0]
+        return
+
+    while next_url:
+        data, links = _get_page(session, token, next_url, None, conditional)
+        yield data
+        next_url = _link(links, "next")
+
+def iter_records(base_url, token, url, params=None, max_workers=None, conditional=True):
+    """Yield individual records from every page of a Canvas list endpoint."""
+    for page in iter_pages(base_url, token, url, params, max_workers, conditional):
+        yield from page
+
+def get_all(base_url, token, url, params=None, max_workers=None, conditional=True):
+    return list(iter_records(base_url, token, url, params, max_workers, conditional))
+
 # ------------------------------------------------------------
 # Courses
 # ------------------------------------------------------------
 def get_courses_by_ids(base_url, token, course_ids):
-    headers = _headers(token)
+    session = get_session(base_url, token)
     courses = []
 
     for cid in course_ids:
         url = f"{base_url}/courses/{cid}"
-        resp = requests.get(url, headers=headers)
+        resp = session.get(url)
 
         if resp.status_code == 200:
-            data = resp.json()
-            courses.append({
+            data = payloads.loads(resp.content)
+            courses.append(ingest_dates({
                 "id": data.get("id"),
                 "name": data.get("name"),
                 "course_code": data.get("course_code"),
                 "term": data.get("term", {}).get("name"),
                 "start_at": data.get("start_at"),
                 "end_at": data.get("end_at"),
-            })
+            }, COURSE_DATE_FIELDS))
         else:
-            courses.append({
+            courses.append(ingest_dates({
                 "id": cid,
                 "name": f"(Error fetching course {cid})",
                 "course_code": "N/A",
@@ -52,7 +279,7 @@ def get_courses_by_ids(base_url, token, course_ids):
                 "start_at": None,
                 "end_at": None,
                 "error": True,
-            })
+            }, COURSE_DATE_FIELDS))
 
     return courses
 
@@ -63,33 +290,106 @@ def get_students(base_url, course_id, token):
     url = f"{base_url}/courses/{course_id}/users"
     params = {
         "enrollment_type[]": "student",
-        "per_page": 100,
+        "per_page": PAGE_SIZE,
     }
-    return cached_get(url, _headers(token), params)
+    return cached_get(base_url, token, url, params, paginated=True)
 
 # ------------------------------------------------------------
 # Assignments (course-level, no submissions)
 # ------------------------------------------------------------
 def get_assignments(base_url, course_id, token):
     url = f"{base_url}/courses/{course_id}/assignments"
-    params = {"per_page": 100}
-    resp = requests.get(url, headers=_headers(token), params=params)
-    resp.raise_for_status()
-    return resp.json()
+    params = {"per_page": PAGE_SIZE}
+    return cached_get(base_url, token, url, params, paginated=True, ingest=ingest_assignment)
+
+def ingest_assignment(assignment):
+    """Parse due/lock dates once into *_ts epochs and *_display strings."""
+    return ingest_dates(assignment, ASSIGNMENT_DATE_FIELDS)
 
 
 # ------------------------------------------------------------
-# Submissions (assignment-level)
+# Submissions
 # ------------------------------------------------------------
-def get_submissions(base_url, course_id, assignment_ids, token):
+def get_submissions(base_url, course_id, assignment_ids, token, bulk=True):
+    """
+    Return {assignment_id: [submissions]} for the given assignments.
+    Uses the course-level bulk endpoint, falling back to one request per
+    assignment if Canvas rejects the bulk call.
+    """
+    if bulk:
+        try:
+            return get_submissions_bulk(base_url, course_id, assignment_ids, token)
+        except requests.HTTPError:
+            pass
+    return get_submissions_per_assignment(base_url, course_id, assignment_ids, token)
+
+def get_submissions_bulk(base_url, course_id, assignment_ids, token):
+    """
+    Fetch submissions for many assignments at once via
+    /courses/:id/students/submissions, batching assignment_ids[] to keep
+    URLs short, and regroup them by assignment.
+    """
+    submissions = {str(aid): [] for aid in assignment_ids}
+    ids = list(assignment_ids)
+    url = f"{base_url}/courses/{course_id}/students/submissions"
+
+    for i in range(0, len(ids), SUBMISSION_BATCH_SIZE):
+        params = {
+            "student_ids[]": "all",
+            "assignment_ids[]": ids[i:i + SUBMISSION_BATCH_SIZE],
+            "per_page": PAGE_SIZE,
+        }
+        for sub in cached_get(base_url, token, url, params, paginated=True):
+            aid = str(sub.get("assignment_id"))
+            if aid in submissions:
+                submissions[aid].append(sub)
+
+    return submissions
+
+def sync_submissions(base_url, course_id, assignment_ids, token):
+    """
+    Incremental version of get_submissions backed by a local store.
+
+    Each assignment is copied once (seeded) through assignment_ids[]
+    batches; a later call with a wider date range seeds only the new ones.
+    Seeded assignments are kept current by asking Canvas for submissions
+    submitted or graded since the previous sync. Once a day the course is
+    dropped and the requested assignments are seeded again.
+    """
+    url = f"{base_url}/courses/{course_id}/students/submissions"
+    # Step back a minute so changes made during the last sync aren't missed
+    synced_at = (datetime.now(utc) - timedelta(minutes=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    last = _submission_store.last_sync(token, course_id)
+    full = last is None or last[1] < time.time() - FULL_SYNC_MAX_AGE
+
+    changed = []
+    if full:
+        seed = [str(aid) for aid in assignment_ids]
+    else:
+        seeded = _submission_store.seeded(token, course_id)
+        seed = [str(aid) for aid in assignment_ids if str(aid) not in seeded]
+        for since in ("submitted_since", "graded_since"):
+            params = {"student_ids[]": "all", since: last[0], "per_page": PAGE_SIZE}
+            changed.extend(get_all(base_url, token, url, params, conditional=False))
+
+    for i in range(0, len(seed), SUBMISSION_BATCH_SIZE):
+        params = {
+            "student_ids[]": "all",
+            "assignment_ids[]": seed[i:i + SUBMISSION_BATCH_SIZE],
+            "per_page": PAGE_SIZE,
+        }
+        changed.extend(get_all(base_url, token, url, params))
+    _submission_store.save(token, course_id, changed, synced_at, seeded=seed, full=full)
+
+    return _submission_store.load(token, course_id, assignment_ids)
+
+def get_submissions_per_assignment(base_url, course_id, assignment_ids, token):
     submissions = {}
 
     for aid in assignment_ids:
         url = f"{base_url}/courses/{course_id}/assignments/{aid}/submissions"
-        params = {"per_page": 100}
-        resp = requests.get(url, headers=_headers(token), params=params)
-        resp.raise_for_status()
-        submissions[str(aid)] = resp.json()
+        params = {"per_page": PAGE_SIZE}
+        submissions[str(aid)] = cached_get(base_url, token, url, params, paginated=True)
 
     return submissions
 
@@ -111,7 +411,7 @@ def merge_assignments_and_submissions(assignments, submissions):
 # ------------------------------------------------------------
 def get_course(base_url, course_id, token):
     url = f"{base_url}/courses/{course_id}"
-    return cached_get(url, _headers(token))
+    return cached_get(base_url, token, url)
 
 # ------------------------------------------------------------
 # Send Canvas Inbox message
@@ -125,34 +425,228 @@ def send_inbox_message(base_url, token, recipient_id, subject, body):
         "force_new": True,
     }
 
-    resp = requests.post(url, headers=_headers(token), data=payload)
+    resp = get_session(base_url, token).post(url, data=payload)
+    rate_limit = _rate_limit_info(resp)
 
     if resp.status_code in (200, 201):
-        return {"success": True, "data": resp.json()}
+        return {"success": True, "data": resp.json(), **rate_limit}
+
+    return {
+        "success": False,
+        "error": f"{resp.status_code}: {resp.text}",
+        **rate_limit,
+    }
+
+def send_bulk_inbox_message(base_url, token, recipient_ids, subject, body):
+    """
+    Send the same message to many recipients in one POST. With
+    bulk_message each recipient still gets their own private conversation.
+    """
+    url = f"{base_url}/conversations"
+    payload = {
+        "recipients[]": list(recipient_ids),
+        "subject": subject,
+        "body": body,
+        "group_conversation": True,
+        "bulk_message": True,
+        "force_new": True,
+    }
+
+    resp = get_session(base_url, token).post(url, data=payload)
+    rate_limit = _rate_limit_info(resp)
+
+    if resp.status_code in (200, 201, 202):
+        return {"success": True, "data": resp.json(), **rate_limit}
 
     return {
         "success": False,
         "error": f"{resp.status_code}: {resp.text}",
+        **rate_limit,
+    }
+
+def _float_header(resp, name):
+    try:
+        return float(resp.headers[name])
+    except (KeyError, ValueError):
+        return None
+
+def _rate_limit_info(resp):
+    """Status code and Canvas throttling headers for a response."""
+    return {
+        "status_code": resp.status_code,
+        "rate_limit_remaining": _float_header(resp, "X-Rate-Limit-Remaining"),
+        "request_cost": _float_header(resp, "X-Request-Cost"),
+        "retry_after": _float_header(resp, "Retry-After"),
     }
     
     
 def filter_assignments_by_date(assignments, start_date, end_date):
+    if not has_timezone(start_date):
+        start_date = utc.localize(start_date)
+    if not has_timezone(end_date):
+        end_date = utc.localize(end_date)
+    start_ts = start_date.timestamp()
+    end_ts = end_date.timestamp()
+
     filtered = []
     for a in assignments:
-        due_at = a.get("due_at")
-        if not due_at:
+        if not a.get("due_at"):
             continue
 
-        due = datetime.fromisoformat(due_at.replace("Z", "+00:00"))
+        # Assignments from get_assignments already carry due_ts
+        due_ts = a["due_ts"] if "due_ts" in a else to_epoch(a["due_at"])
 
-        if not has_timezone(start_date):
-            start_date = utc.localize(start_date)
-        if not has_timezone(end_date):
-            end_date = utc.localize(end_date)
-        if not has_timezone(due):
-            due = utc.localize(due)
-
-        if start_date <= due <= end_date:
+        if due_ts is not None and start_ts <= due_ts <= end_ts:
             filtered.append(a)
 
-    return filtered
\ No newline at end of file
+    return filtered
+
+
+# ------------------------------------------------------------
+# Multi-course fetch pipeline
+# ------------------------------------------------------------
+def _fetch_course_assignments(base_url, token, cid, start, end):
+    assignments_raw = get_assignments(base_url, cid, token)
+    assignments = filter_assignments_by_date(assignments_raw, start, end)
+
+    # Start on submissions as soon as this course's assignments are known
+    assignment_ids = [a["id"] for a in assignments]
+    submissions = None
+    if INCREMENTAL_SYNC:
+        try:
+            submissions = sync_submissions(base_url, cid, assignment_ids, token)
+        except requests.HTTPError:
+            pass
+    if submissions is None:
+        submissions = get_submissions(base_url, cid, assignment_ids, token)
+    return assignments, submissions
+
+@metrics.timed("fetch_course_data")
+def fetch_course_data(base_url, token, courses, start, end, max_workers=None):
+    """
+    Fetch students, in-range assignments and their submissions for every
+    course concurrently on a bounded worker pool.
+
+    Returns (students_map, assignments_map, submissions_map) keyed by
+    course id, ready for workflow.build_weekly_status.
+    """
+    students_futures = {}
+    assignments_futures = {}
+
+    fetch_students = metrics.bind(get_students)
+    fetch_assignments = metrics.bind(_fetch_course_assignments)
+
+    with ThreadPoolExecutor(max_workers=max_workers or COURSE_WORKERS) as pool:
+        for course in courses:
+            cid = str(course["id"])
+            students_futures[cid] = pool.submit(fetch_students, base_url, cid, token)
+            assignments_futures[cid] = pool.submit(
+                fetch_assignments, base_url, token, cid, start, end
+            )
+
+    students_map = {}
+    assignments_map = {}
+    submissions_map = {}
+
+    for course in courses:
+        cid = str(course["id"])
+        students_map[cid] = students_futures[cid].result()
+        assignments_map[cid], submissions_map[cid] = assignments_futures[cid].result()
+
+    return students_map, assignments_map, submissions_map
+
+def _fetch_course(base_url, token, course, start, end):
+    cid = str(course["id"])
+    students = get_students(base_url, cid, token)
+    assignments, submissions = _fetch_course_assignments(base_url, token, cid, start, end)
+    return students, assignments, submissions
+
+def iter_course_data(base_url, token, courses, start, end, max_workers=None):
+    """
+    Yield (course, (students, assignments, submissions), error) for each
+    course as soon as that course is fetched, fastest first. A course that
+    could not be fetched comes back with data None and the exception, so
+    one bad course does not end the iteration.
+    """
+    fetch = metrics.bind(_fetch_course)
+    pool = ThreadPoolExecutor(max_workers=max_workers or COURSE_WORKERS)
+    futures = {pool.submit(fetch, base_url, token, course, start, end): course for course in courses}
+    try:
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as exc:
+                yield futures[future], None, exc
+    finally:
+        # Client went away mid-stream: don't start courses for nobody
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ------------------------------------------------------------
+# Async API
+# ------------------------------------------------------------
+# Each call runs its blocking request on a worker thread outside the
+# event loop (thread_sensitive=False), reusing the pooled sessions above,
+# so an ASGI worker keeps serving other requests while Canvas responds.
+def _to_async(func):
+    return sync_to_async(func, thread_sensitive=False)
+
+aget_students = _to_async(get_students)
+aget_assignments = _to_async(get_assignments)
+aget_submissions = _to_async(get_submissions)
+aget_course = _to_async(get_course)
+asend_inbox_message = _to_async(send_inbox_message)
+
+async def aget_courses_by_ids(base_url, token, course_ids):
+    fetch = _to_async(get_courses_by_ids)
+    results = await asyncio.gather(*(fetch(base_url, token, [cid]) for cid in course_ids))
+    return [course for result in results for course in result]
+
+async def afetch_course_data(base_url, token, courses, start, end, max_workers=None):
+    """Async counterpart of fetch_course_data with the same return value."""
+    limit = asyncio.Semaphore(max_workers or COURSE_WORKERS)
+    fetch_assignments = _to_async(_fetch_course_assignments)
+
+    async def bounded(coro):
+        async with limit:
+            return await coro
+
+    cids = [str(course["id"]) for course in courses]
+    students, assignments = await asyncio.gather(
+        asyncio.gather(*(bounded(aget_students(base_url, cid, token)) for cid in cids)),
+        asyncio.gather(*(bounded(fetch_assignments(base_url, token, cid, start, end)) for cid in cids)),
+    )
+
+    students_map = dict(zip(cids, students))
+    assignments_map = {cid: result[0] for cid, result in zip(cids, assignments)}
+    submissions_map = {cid: result[1] for cid, result in zip(cids, assignments)}
+    return students_map, assignments_map, submissions_map
+
+async def aiter_course_data(base_url, token, courses, start, end, max_workers=None):
+    """Async counterpart of iter_course_data with the same items."""
+    limit = asyncio.Semaphore(max_workers or COURSE_WORKERS)
+    fetch_assignments = _to_async(_fetch_course_assignments)
+
+    async def bounded(coro):
+        async with limit:
+            return await coro
+
+    async def fetch(course):
+        cid = str(course["id"])
+        try:
+            students, (assignments, submissions) = await asyncio.gather(
+                bounded(aget_students(base_url, cid, token)),
+                bounded(fetch_assignments(base_url, token, cid, start, end)),
+            )
+        except Exception as exc:
+            return course, None, exc
+        return course, (students, assignments, submissions), None
+
+    tasks = [asyncio.ensure_future(fetch(course)) for course in courses]
+    try:
+        for done in asyncio.as_completed(tasks):
+            yield await done
+    finally:
+        # Client went away mid-stream: don't keep fetching for nobody
+        for task in tasks:
+            task.cancel()
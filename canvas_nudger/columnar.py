@@ -0,0 +1,176 @@
+"""
+Optional NumPy-backed engine for build_weekly_status, meant for
+department-wide runs with thousands of enrollments.
+
+Submissions are packed into student x assignment arrays, every student is
+classified with array operations, and the per-student assignment lists the
+templates and generate_message read are only built when they are accessed.
+"""
+from collections.abc import Mapping, Sequence
+from datetime import datetime
+from pytz import utc
+from . import metrics
+from .records import AssignmentRow
+from .workflow import _is_assignment_expired
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+COMPLETED, MISSING, EXPIRED = 0, 1, 2
+_LIST_CODES = {
+    "completed_assignments": COMPLETED,
+    "missing_assignments": MISSING,
+    "expired_assignments": EXPIRED,
+}
+_ENCODE = str.maketrans({chr(COMPLETED): "C", chr(MISSING): "M", chr(EXPIRED): "E"})
+
+# Switch to this engine once a report has this many student x assignment cells
+MIN_CELLS = 20000
+
+
+def available():
+    return np is not None
+
+
+def should_use(students_map, assignments_map):
+    if np is None:
+        return False
+    cells = sum(len(students_map[cid]) * len(assignments_map[cid]) for cid in students_map)
+    return cells >= MIN_CELLS
+
+
+class ColumnarCourse:
+    __slots__ = ("students", "assignments", "codes")
+
+    def __init__(self, students, assignments, codes):
+        self.students = students
+        self.assignments = assignments  # AssignmentRow per column
+        self.codes = codes  # int8 matrix, one row per student
+
+
+class StudentStatus(Mapping):
+    """Read-only view of one student's row, shaped like build_weekly_status output."""
+
+    __slots__ = ("_course", "_row")
+    _KEYS = (
+        "id",
+        "name",
+        "completed_all",
+        "completed_assignments",
+        "missing_assignments",
+        "expired_assignments",
+    )
+
+    def __init__(self, course, row):
+        self._course = course
+        self._row = row
+
+    def __getitem__(self, key):
+        course = self._course
+        if key == "id":
+            return course.students[self._row]["id"]
+        if key == "name":
+            return course.students[self._row].get("name")
+        if key == "completed_all":
+            return not bool((course.codes[self._row] == MISSING).any())
+        if key in _LIST_CODES:
+            cols = np.flatnonzero(course.codes[self._row] == _LIST_CODES[key])
+            return [course.assignments[j] for j in cols]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
+
+    def status_codes(self, positions=None):
+        """Same encoding as records.StudentRow.status_codes."""
+        return self._course.codes[self._row].tobytes().decode("latin-1").translate(_ENCODE)
+
+
+class StudentList(Sequence):
+    __slots__ = ("course",)
+
+    def __init__(self, course):
+        self.course = course
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return StudentStatus(self.course, index)
+
+    def __len__(self):
+        return len(self.course.students)
+
+
+def _classify(students, assignments, course_submissions, now):
+    """Return an int8 matrix of COMPLETED / MISSING / EXPIRED codes."""
+    # Students can appear more than once in a roster; classify each id once
+    uniq = {}
+    student_rows = np.fromiter(
+        (uniq.setdefault(str(s["id"]), len(uniq)) for s in students),
+        dtype=np.intp,
+        count=len(students),
+    )
+    shape = (len(uniq), len(assignments))
+
+    # First submission per (student, assignment), like the dict engine
+    cells = {}
+    for j, assignment in enumerate(assignments):
+        for sub in course_submissions.get(str(assignment["id"]), ()):
+            u = uniq.get(str(sub.get("user_id")))
+            if u is not None:
+                cells.setdefault((u, j), sub)
+
+    n = len(cells)
+    rows = np.fromiter((k[0] for k in cells), dtype=np.intp, count=n)
+    cols = np.fromiter((k[1] for k in cells), dtype=np.intp, count=n)
+    subs = list(cells.values())
+
+    has_submitted_at = np.zeros(shape, dtype=bool)
+    has_submitted_at[rows, cols] = np.fromiter((bool(s.get("submitted_at")) for s in subs), dtype=bool, count=n)
+    score = np.full(shape, np.nan)
+    score[rows, cols] = np.fromiter(
+        (np.nan if s.get("score") is None else s["score"] for s in subs), dtype=float, count=n
+    )
+    excused = np.zeros(shape, dtype=bool)
+    excused[rows, cols] = np.fromiter((bool(s.get("excused", False)) for s in subs), dtype=bool, count=n)
+
+    expired = np.fromiter(
+        (_is_assignment_expired(a, now) for a in assignments), dtype=bool, count=len(assignments)
+    )
+
+    submitted = has_submitted_at | (score > 0) | excused
+    codes = np.where(submitted, COMPLETED, np.where(expired, EXPIRED, MISSING)).astype(np.int8)
+    return codes[student_rows]
+
+
+@metrics.timed("build_weekly_status_columnar")
+def build_weekly_status_columnar(courses, students_map, assignments_map, submissions_map):
+    """Same inputs and report shape as workflow.build_weekly_status."""
+    report = {"courses": []}
+    now = datetime.now(utc)
+
+    for course in courses:
+        cid = str(course["id"])
+        students = students_map[cid]
+        assignments = assignments_map[cid]
+        codes = _classify(students, assignments, submissions_map[cid], now)
+        rows = [AssignmentRow.from_canvas(a) for a in assignments]
+
+        report["courses"].append({
+            "id": cid,
+            "name": course["name"],
+            "assignments": rows,
+            "students": StudentList(ColumnarCourse(students, rows, codes)),
+        })
+
+    return report
+
@@ -0,0 +1,47 @@
+"""
+Canvas timestamp helpers. Dates are parsed once when data is ingested
+and kept as epoch seconds plus a display string, so filtering, expiry
+checks and templates don't have to parse ISO strings again.
+"""
+from datetime import datetime
+from pytz import utc
+
+DISPLAY_FORMAT = "%b %d, %Y"
+
+
+def parse_canvas_date(value):
+    """Parse a Canvas ISO 8601 string into an aware datetime (UTC if naive)."""
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None or dt.tzinfo.utcoffset(dt) is None:
+        dt = utc.localize(dt)
+    return dt
+
+
+def to_epoch(value):
+    """Epoch seconds for a Canvas date string, or None if missing or invalid."""
+    if not value:
+        return None
+    try:
+        return int(parse_canvas_date(value).timestamp())
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def display_date(value):
+    """Convert Canvas ISO8601 date to 'Feb 7, 2026'."""
+    if not value:
+        return "Unknown"
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).strftime(DISPLAY_FORMAT)
+    except Exception:
+        return value  # fallback
+
+
+def ingest_dates(record, fields):
+    """Add <field>_ts and <field>_display keys for each *_at field, in place."""
+    for field in fields:
+        base = field[:-3] if field.endswith("_at") else field
+        value = record.get(field)
+        record[f"{base}_ts"] = to_epoch(value)
+        record[f"{base}_display"] = display_date(value)
+    return record
@@ -1,25 +1,138 @@
 import json
+import os
+import tempfile
+from contextlib import contextmanager
 from pathlib import Path
+from threading import RLock
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 DEFAULTS_FILE = Path(__file__).resolve().parent / ".env" / "defaults.json"
 
+
+class DefaultsStore:
+    """
+    Process-wide copy of defaults.json. Reads are served from memory and
+    revalidated with a single stat(); writes go through a temp file and
+    an atomic rename while holding a lock file, so other workers never
+    see a half-written file and concurrent updates don't lose keys.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path.with_name(path.name + ".lock")
+        self.generation = 0
+        self._data = {}
+        self._stamp = None
+        self._lock = RLock()
+
+    def _current_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _refresh(self):
+        stamp = self._current_stamp()
+        if stamp == self._stamp:
+            return
+
+        with self._lock:
+            if stamp is None:
+                data = {}
+            else:
+                try:
+                    with open(self.path, "r") as f:
+                        data = json.load(f)
+                        st = os.fstat(f.fileno())
+                        stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+                except FileNotFoundError:
+                    data, stamp = {}, None
+            self._data = data
+            self._stamp = stamp
+            self.generation += 1
+
+    def version(self):
+        """Changes whenever the file's contents may have changed."""
+        self._refresh()
+        return self.generation
+
+    def load(self):
+        self._refresh()
+        return dict(self._data)
+
+    @contextmanager
+    def _file_lock(self):
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.lock_path, "a+") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _write(self, data):
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=".defaults-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        self._refresh()
+
+    def save(self, data):
+        with self._file_lock():
+            self._write(data)
+
+    def update(self, partial_dict):
+        # Re-read under the lock so keys written by another worker survive
+        with self._file_lock():
+            self._refresh()
+            data = dict(self._data)
+            data.update(partial_dict)
+            self._write(data)
+
+
+_store = DefaultsStore(DEFAULTS_FILE)
+
 def load_defaults():
-    if DEFAULTS_FILE.exists():
-        with open(DEFAULTS_FILE, "r") as f:
-            return json.load(f)
-    return {}
+    return _store.load()
 
 def save_defaults(data):
-    with open(DEFAULTS_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    _store.save(data)
 
 def update_defaults(partial_dict):
     """
     Update only the keys provided in parital_dict, preseving all other keys in defaults.json
     """
-    data = load_defaults()
-    data.update(partial_dict)
-    save_defaults(data)
+    _store.update(partial_dict)
+
+def defaults_version():
+    """
+    Cheap token that changes whenever defaults.json changes, whether it
+    was saved by this process or edited on disk.
+    """
+    return _store.version()
 
 def get_message_templates():
     d = load_defaults()
@@ -29,7 +142,7 @@ def get_message_templates():
     }
 
 def save_message_templates(congrats, encourage):
-    d = load_defaults()
-    d["template_congrats"] = congrats
-    d["template_encourage"] = encourage
-    save_defaults(d)
+    update_defaults({
+        "template_congrats": congrats,
+        "template_encourage": encourage,
+    })
@@ -0,0 +1,314 @@
+"""
+A local stand-in for the parts of the Canvas REST API this app uses, for
+benchmarks and manual testing without a live Canvas instance.
+
+Serves synthetic courses, rosters, assignments and submissions with
+Link-header pagination, ETags, optional latency, and a leaky-bucket rate
+limiter that reports X-Rate-Limit-Remaining / X-Request-Cost and answers
+403 (Rate Limit Exceeded) when the bucket runs dry, like Canvas does.
+
+    with FakeCanvas(courses=5, students=300, latency=0.05) as canvas:
+        canvas_client.get_courses_by_ids(canvas.base_url, "token", canvas.course_ids)
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+from .workflow import get_last_week_range
+
+# Filler that makes payloads about as heavy as real Canvas records
+_DESCRIPTION = "<p>Read the chapter and answer the questions below.</p>" * 20
+
+
+class FakeCanvas:
+    def __init__(
+        self,
+        courses=3,
+        students=100,
+        assignments=12,
+        latency=0.0,
+        max_per_page=100,
+        rate_limit=700.0,
+        request_cost=1.0,
+        refill_rate=10.0,
+        start=None,
+        end=None,
+        seed=0,
+    ):
+        self.n_courses = courses
+        self.n_students = students
+        self.n_assignments = assignments
+        self.latency = latency
+        self.max_per_page = max_per_page
+        self.rate_limit = rate_limit
+        self.request_cost = request_cost
+        self.refill_rate = refill_rate
+        self.seed = seed
+
+        if start is None or end is None:
+            start, end = get_last_week_range()
+        self.start_date = start
+        self.end_date = end
+
+        self.course_ids = [str(1000 + i) for i in range(1, courses + 1)]
+        self.calls = Counter()
+        self.sent = 0
+
+        self._data = {}
+        self._data_lock = threading.Lock()
+        self._bucket = rate_limit
+        self._bucket_at = time.monotonic()
+        self._bucket_lock = threading.Lock()
+        self._server = None
+
+    # --------------------------------------------------------
+    # Lifecycle
+    # --------------------------------------------------------
+    def start(self, host="127.0.0.1", port=0):
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.canvas = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    # --------------------------------------------------------
+    # Synthetic data
+    # --------------------------------------------------------
+    def course(self, course_id):
+        """Return (course, students, assignments, {assignment_id: submissions})."""
+        with self._data_lock:
+            if course_id not in self._data:
+                self._data[course_id] = self._generate(course_id)
+            return self._data[course_id]
+
+    def _generate(self, course_id):
+        rng = random.Random(f"{self.seed}:{course_id}")
+        cid = int(course_id)
+        course = {
+            "id": cid,
+            "name": f"Course {course_id}",
+            "course_code": f"FAKE-{course_id}",
+            "term": {"name": "Benchmark Term"},
+            "start_at": (self.start_date - timedelta(days=60)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "end_at": (self.end_date + timedelta(days=60)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+
+        students = [
+            {"id": cid * 100000 + i, "name": f"Student {course_id}-{i:04d}", "sortable_name": f"{i:04d}, Student"}
+            for i in range(1, self.n_students + 1)
+        ]
+
+        # Due dates spread over the report window; a third lock in the past,
+        # a third in the future and a third never lock
+        span = (self.end_date - self.start_date) / max(1, self.n_assignments)
+        assignments = []
+        for j in range(self.n_assignments):
+            due = self.start_date + span * j + timedelta(minutes=1)
+            lock = {0: due + timedelta(hours=1), 1: due + timedelta(days=3650), 2: None}[j % 3]
+            assignments.append({
+                "id": cid * 1000 + j,
+                "name": f"Assignment {j + 1}",
+                "description": _DESCRIPTION,
+                "due_at": due.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "lock_at": lock.strftime("%Y-%m-%dT%H:%M:%SZ") if lock else None,
+                "points_possible": 10,
+                "html_url": f"https://canvas.example/courses/{course_id}/assignments/{cid * 1000 + j}",
+                "rubric": [{"description": "Criterion", "points": 10}],
+            })
+
+        submissions = {}
+        next_id = 1
+        for a in assignments:
+            rows = submissions[a["id"]] = []
+            for s in students:
+                roll = rng.random()
+                submitted = roll < 0.6
+                rows.append({
+                    "id": next_id,
+                    "assignment_id": a["id"],
+                    "user_id": s["id"],
+                    "submitted_at": a["due_at"] if submitted else None,
+                    "score": rng.randint(1, 10) if submitted or roll < 0.7 else None,
+                    "excused": 0.7 <= roll < 0.75,
+                    "workflow_state": "graded" if submitted else "unsubmitted",
+                    "submission_history": [],
+                })
+                next_id += 1
+
+        return course, students, assignments, submissions
+
+    # --------------------------------------------------------
+    # Rate limiting
+    # --------------------------------------------------------
+    def refill(self):
+        """Top the rate-limit bucket back up, e.g. between benchmark runs."""
+        with self._bucket_lock:
+            self._bucket = self.rate_limit
+            self._bucket_at = time.monotonic()
+
+    def _spend(self, cost):
+        """Charge a request against the bucket; return the remaining balance."""
+        with self._bucket_lock:
+            now = time.monotonic()
+            self._bucket = min(self.rate_limit, self._bucket + (now - self._bucket_at) * self.refill_rate)
+            self._bucket_at = now
+            self._bucket -= cost
+            return self._bucket
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    ROUTES = [
+        ("course", re.compile(r"/api/v1/courses/(\d+)$")),
+        ("users", re.compile(r"/api/v1/courses/(\d+)/users$")),
+        ("assignments", re.compile(r"/api/v1/courses/(\d+)/assignments$")),
+        ("assignment_submissions", re.compile(r"/api/v1/courses/(\d+)/assignments/(\d+)/submissions$")),
+        ("bulk_submissions", re.compile(r"/api/v1/courses/(\d+)/students/submissions$")),
+        ("conversations", re.compile(r"/api/v1/conversations$")),
+    ]
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def canvas(self):
+        return self.server.canvas
+
+    def _route(self, path):
+        for name, pattern in self.ROUTES:
+            m = pattern.match(path)
+            if m:
+                return name, m.groups()
+        return None, ()
+
+    def _throttle(self):
+        """Apply latency and rate limiting; return the headers to send, or None if refused."""
+        canvas = self.canvas
+        if canvas.latency:
+            time.sleep(canvas.latency)
+
+        remaining = canvas._spend(canvas.request_cost)
+        headers = {
+            "X-Rate-Limit-Remaining": f"{max(remaining, 0):.1f}",
+            "X-Request-Cost": f"{canvas.request_cost:.1f}",
+        }
+        if remaining < 0:
+            self._send(403, b"403 Forbidden (Rate Limit Exceeded)", headers, "text/plain")
+            return None
+        return headers
+
+    def _send(self, status, body, headers=None, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        try:
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up first, e.g. its read timed out
+            pass
+
+    def _send_json(self, data, headers, url, query):
+        if isinstance(data, list):
+            data, links = self._paginate(data, url, query)
+            if links:
+                headers["Link"] = links
+
+        body = json.dumps(data).encode()
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        headers["ETag"] = etag
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", headers)
+            return
+        self._send(200, body, headers)
+
+    def _paginate(self, items, url, query):
+        per_page = min(int(query.get("per_page", ["10"])[0]), self.canvas.max_per_page)
+        page = int(query.get("page", ["1"])[0])
+        last = max(1, -(-len(items) // per_page))
+
+        rest = urlencode([(k, v) for k, vs in query.items() if k != "page" for v in vs])
+        base = f"http://{self.headers.get('Host')}{url.path}?{rest}&page="
+        links = [f'<{base}{page}>; rel="current"', f'<{base}1>; rel="first"', f'<{base}{last}>; rel="last"']
+        if page < last:
+            links.append(f'<{base}{page + 1}>; rel="next"')
+        return items[(page - 1) * per_page:page * per_page], ",".join(links)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        name, groups = self._route(url.path)
+        if name is None or name == "conversations":
+            self._send(404, b'{"errors":[{"message":"not found"}]}')
+            return
+
+        self.canvas.calls[name] += 1
+        headers = self._throttle()
+        if headers is None:
+            return
+
+        course_id = groups[0]
+        if course_id not in self.canvas.course_ids:
+            self._send(404, b'{"errors":[{"message":"The specified resource does not exist."}]}', headers)
+            return
+        course, students, assignments, submissions = self.canvas.course(course_id)
+
+        if name == "course":
+            data = course
+        elif name == "users":
+            data = students
+        elif name == "assignments":
+            data = assignments
+        elif name == "assignment_submissions":
+            data = submissions.get(int(groups[1]), [])
+        else:
+            ids = [int(a) for a in query.get("assignment_ids[]", [])] or list(submissions)
+            data = [s for aid in ids for s in submissions.get(aid, [])]
+            # Nothing changes between runs, so incremental syncs come back empty
+            if "submitted_since" in query or "graded_since" in query:
+                data = []
+        self._send_json(data, headers, url, query)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        name, _ = self._route(urlsplit(self.path).path)
+        if name != "conversations":
+            self._send(404, b'{"errors":[{"message":"not found"}]}')
+            return
+
+        self.canvas.calls[name] += 1
+        headers = self._throttle()
+        if headers is None:
+            return
+
+        recipients = form.get("recipients[]", [])
+        self.canvas.sent += len(recipients)
+        data = [{"id": i + 1, "subject": form.get("subject", [""])[0]} for i in range(len(recipients))]
+        self._send(201, json.dumps(data).encode(), headers)
@@ -0,0 +1,293 @@
+"""
+Background send jobs. A job's messages are written to the database
+first, then a small in-process thread pool sends them and records each
+result as it arrives, so progress survives a closed tab or a proxy
+timeout and can be polled from the browser.
+
+Every message also gets an idempotency key recorded in the send journal.
+A job claims each key before sending it, so a resumed or resubmitted
+batch, or two jobs running at once, skips students already messaged.
+
+While a job is queued or running, its process writes a heartbeat to it.
+A job whose heartbeat is older than LEASE is treated as dead: it can be
+resumed, and other jobs may take over the keys it had claimed.
+"""
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Lock, Thread
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from . import sender
+from .models import SendJob, SendJobMessage, SendJournalEntry
+
+# Jobs that may run at the same time in this process
+JOB_WORKERS = 2
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="send-job")
+
+# Jobs queued or running in this process
+_active = set()
+_active_lock = Lock()
+
+# Seconds between heartbeats, and how long a job may go without one
+# before another process treats it as dead
+HEARTBEAT_INTERVAL = 15
+LEASE = 90
+
+# The heartbeat thread, while any job is active here
+_heartbeat = None
+
+
+def idempotency_key(course_id, student_id, week, body):
+    body_hash = hashlib.sha256(body.encode()).hexdigest()
+    raw = f"{course_id}:{student_id}:{week}:{body_hash}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def submit_send_job(base_url, token, items, week, start=True):
+    """
+    Queue items for sending and return the new job's ID. With
+    start=False the job is only recorded; call run_send_job to send it.
+
+    items: list of dicts with course_id, course_name, student_id,
+    student_name, subject and body.
+    week: the report period the messages are about, part of each
+    message's idempotency key.
+    """
+    keys = [idempotency_key(item["course_id"], item["student_id"], week, item["body"]) for item in items]
+
+    with transaction.atomic():
+        job = SendJob.objects.create(total=len(items), heartbeat_at=timezone.now())
+        SendJobMessage.objects.bulk_create([
+            SendJobMessage(job=job, position=i, idempotency_key=key, **item)
+            for i, (key, item) in enumerate(zip(keys, items))
+        ])
+        SendJournalEntry.objects.bulk_create(
+            [
+                SendJournalEntry(
+                    idempotency_key=key,
+                    course_id=item["course_id"],
+                    student_id=item["student_id"],
+                    week=week,
+                )
+                for key, item in zip(keys, items)
+            ],
+            ignore_conflicts=True,
+        )
+
+    if start:
+        _start(job.pk, base_url, token)
+    return job.pk
+
+
+def resume_send_job(job_id, base_url, token, start=True):
+    """
+    Requeue a finished or interrupted job's undelivered messages and run
+    it again; with start=False it is only requeued, for run_send_job.
+    Returns False if the job is unknown or still alive, here or in
+    another process. A job left "running" by a process that died can be
+    resumed once its lease runs out.
+    """
+    with _active_lock:
+        if job_id in _active:
+            return False
+    if not _requeue(job_id):
+        return False
+    if start:
+        _start(job_id, base_url, token)
+    return True
+
+
+def _requeue(job_id):
+    now = timezone.now()
+    # Conditional, so a job another process is still sending (or another
+    # resume has just taken) is left alone
+    updated = SendJob.objects.filter(pk=job_id).exclude(
+        heartbeat_at__gte=now - timedelta(seconds=LEASE)
+    ).update(status=SendJob.QUEUED, finished_at=None, heartbeat_at=now)
+    if not updated:
+        return False
+
+    SendJobMessage.objects.filter(job_id=job_id).exclude(status=SendJobMessage.SENT).update(
+        status=SendJobMessage.QUEUED, error=""
+    )
+    return True
+
+
+def _start(job_id, base_url, token):
+    _track(job_id)
+    # The token is only held in memory; it is never written to the job
+    _executor.submit(run_send_job, job_id, base_url, token)
+
+
+def is_alive(job):
+    """Whether job is queued or running here, or still beating elsewhere."""
+    with _active_lock:
+        if job.pk in _active:
+            return True
+    cutoff = timezone.now() - timedelta(seconds=LEASE)
+    return job.heartbeat_at is not None and job.heartbeat_at >= cutoff
+
+
+# ------------------------------------------------------------
+# Heartbeat
+# ------------------------------------------------------------
+def _track(job_id):
+    """Count job_id as active here and make sure the heartbeat is running."""
+    global _heartbeat
+    with _active_lock:
+        _active.add(job_id)
+        if _heartbeat is None:
+            _heartbeat = Thread(target=_beat, name="send-job-heartbeat", daemon=True)
+            _heartbeat.start()
+
+
+def _beat():
+    global _heartbeat
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        with _active_lock:
+            job_ids = list(_active)
+            if not job_ids:
+                _heartbeat = None
+                break
+        try:
+            SendJob.objects.filter(pk__in=job_ids).update(heartbeat_at=timezone.now())
+        except DatabaseError:
+            # Database busy; the next beat is still well inside the lease
+            pass
+    connection.close()
+
+
+# ------------------------------------------------------------
+# Sending
+# ------------------------------------------------------------
+def _claim(job_id, rows):
+    """
+    Move each row's journal entry to sending, one conditional UPDATE per
+    key, and return the rows this job now holds. A key is claimable when
+    it is pending or failed, or still sending for a job that is dead or
+    is this one (a claim left over from an earlier, interrupted run).
+    """
+    cutoff = timezone.now() - timedelta(seconds=LEASE)
+    abandoned = (
+        Q(claimed_by=job_id)
+        | Q(claimed_by__isnull=True)
+        | Q(claimed_by__heartbeat_at__isnull=True)
+        | Q(claimed_by__heartbeat_at__lt=cutoff)
+    )
+    claimable = Q(status__in=[SendJournalEntry.PENDING, SendJournalEntry.FAILED]) | (
+        Q(status=SendJournalEntry.SENDING) & abandoned
+    )
+
+    claimed = []
+    with transaction.atomic():
+        for row in rows:
+            updated = SendJournalEntry.objects.filter(claimable, idempotency_key=row.idempotency_key).update(
+                status=SendJournalEntry.SENDING, claimed_by=job_id, updated_at=timezone.now()
+            )
+            if updated:
+                claimed.append(row)
+    return claimed
+
+
+def run_send_job(job_id, base_url, token, max_workers=None):
+    # Also when called directly, e.g. by the nudge command
+    _track(job_id)
+    try:
+        SendJob.objects.filter(pk=job_id).update(status=SendJob.RUNNING, heartbeat_at=timezone.now())
+        rows = list(SendJobMessage.objects.filter(job_id=job_id, status=SendJobMessage.QUEUED))
+
+        claimed = _claim(job_id, rows)
+        claimed_ids = {row.pk for row in claimed}
+        unclaimed = [row for row in rows if row.pk not in claimed_ids]
+
+        # Anything not claimed was either delivered already or is being
+        # sent by another live job; a later resume settles the latter
+        delivered = set(
+            SendJournalEntry.objects.filter(
+                idempotency_key__in=[row.idempotency_key for row in unclaimed],
+                status=SendJournalEntry.SENT,
+            ).values_list("idempotency_key", flat=True)
+        )
+        SendJobMessage.objects.filter(
+            pk__in=[row.pk for row in unclaimed if row.idempotency_key in delivered]
+        ).update(status=SendJobMessage.SENT)
+        SendJobMessage.objects.filter(
+            pk__in=[row.pk for row in unclaimed if row.idempotency_key not in delivered]
+        ).update(status=SendJobMessage.FAILED, error="Already being sent by another job")
+
+        rows = claimed
+        outgoing = [
+            {"recipient_id": row.student_id, "subject": row.subject, "body": row.body}
+            for row in rows
+        ]
+
+        def record(index, result):
+            row = rows[index]
+            error = result.get("error") or ""
+            journal = SendJournalEntry.objects.filter(idempotency_key=row.idempotency_key)
+            if result["success"]:
+                SendJobMessage.objects.filter(pk=row.pk).update(status=SendJobMessage.SENT, error="")
+                journal.update(
+                    status=SendJournalEntry.SENT,
+                    attempts=F("attempts") + 1,
+                    last_error="",
+                    sent_at=timezone.now(),
+                    updated_at=timezone.now(),
+                )
+            else:
+                SendJobMessage.objects.filter(pk=row.pk).update(status=SendJobMessage.FAILED, error=error)
+                # Only release our own claim; never turn a sent entry back
+                journal.filter(status=SendJournalEntry.SENDING, claimed_by=job_id).update(
+                    status=SendJournalEntry.FAILED,
+                    attempts=F("attempts") + 1,
+                    last_error=error,
+                    updated_at=timezone.now(),
+                )
+
+        sender.send_messages(base_url, token, outgoing, max_workers=max_workers, bulk=True, on_result=record)
+    finally:
+        SendJob.objects.filter(pk=job_id).update(
+            status=SendJob.DONE, finished_at=timezone.now(), heartbeat_at=None
+        )
+        with _active_lock:
+            _active.discard(job_id)
+        close_old_connections()
+
+
+def job_progress(job_id, full=False):
+    """
+    JSON-ready progress for a job, or None if it does not exist.
+    Messages carry only position, status and error, which is all the
+    status poll needs; full=True gives whole report rows with the bodies.
+    """
+    job = SendJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return None
+
+    alive = is_alive(job)
+
+    if full:
+        messages = [m.as_report_row() for m in job.messages.all()]
+    else:
+        messages = [
+            {"position": position, "status": status, "error": error or None}
+            for position, status, error in job.messages.values_list("position", "status", "error")
+        ]
+    sent = sum(1 for m in messages if m["status"] == SendJobMessage.SENT)
+    return {
+        "id": job.pk,
+        "status": job.status,
+        "total": job.total,
+        "sent": sent,
+        "failed": sum(1 for m in messages if m["status"] == SendJobMessage.FAILED),
+        # Dead, yet something is undelivered: it failed, or the process
+        # or the send stopped before finishing it
+        "active": alive,
+        "resumable": not alive and sent < len(messages),
+        "messages": messages,
+    }
@@ -0,0 +1,234 @@
+"""
+End-to-end benchmark against a local FakeCanvas server.
+
+    python manage.py benchmark --courses 5 --students 300 --latency 20
+
+Times each stage of a report-and-nudge run, prints median / min per
+stage, and appends the result to canvas_nudger/.env/benchmarks.jsonl so
+runs with the same settings can be compared between versions.
+"""
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from ... import canvas_client, columnar, payloads, records, sender
+from ...cache import HttpCache, SubmissionStore
+from ...fakecanvas import FakeCanvas
+from ...views import WeeklyReportView
+from ...workflow import CompiledTemplate, build_weekly_status, generate_message
+
+RESULTS_FILE = Path(__file__).resolve().parents[2] / ".env" / "benchmarks.jsonl"
+SAMPLE_DEFAULTS = Path(__file__).resolve().parents[2] / "defaults.sample.json"
+
+TOKEN = "benchmark-token"
+
+# Flag a stage when its median is this much slower than the previous run
+REGRESSION_THRESHOLD = 0.10
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Time each report and send stage against a local fake Canvas server."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--courses", type=int, default=5)
+        parser.add_argument("--students", type=int, default=200, help="Students per course")
+        parser.add_argument("--assignments", type=int, default=15, help="Assignments per course in range")
+        parser.add_argument("--latency", type=float, default=20.0, help="Fake Canvas latency per request, in ms")
+        parser.add_argument("--max-per-page", type=int, default=100)
+        parser.add_argument("--rate-limit", type=float, default=700.0, help="Fake Canvas rate-limit bucket size")
+        parser.add_argument("--request-cost", type=float, default=0.5, help="Rate-limit cost per fake Canvas request")
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--label", default=None, help="Name for this run (defaults to the git revision)")
+        parser.add_argument("--output", default=str(RESULTS_FILE))
+        parser.add_argument("--no-save", action="store_true", help="Print results without storing them")
+
+    def handle(self, *args, **options):
+        config = {
+            "courses": options["courses"],
+            "students": options["students"],
+            "assignments": options["assignments"],
+            "latency_ms": options["latency"],
+            "max_per_page": options["max_per_page"],
+            "rate_limit": options["rate_limit"],
+            "request_cost": options["request_cost"],
+        }
+
+        canvas = FakeCanvas(
+            courses=config["courses"],
+            students=config["students"],
+            assignments=config["assignments"],
+            latency=config["latency_ms"] / 1000,
+            max_per_page=config["max_per_page"],
+            rate_limit=config["rate_limit"],
+            request_cost=config["request_cost"],
+        )
+
+        # Keep the run away from the real on-disk caches
+        saved_stores = (canvas_client._http_cache, canvas_client._submission_store)
+        with tempfile.TemporaryDirectory() as tmp, canvas:
+            canvas_client._http_cache = HttpCache(Path(tmp) / "http_cache.sqlite3")
+            canvas_client._submission_store = SubmissionStore(Path(tmp) / "submissions.sqlite3")
+            try:
+                runs = [self._run(canvas) for _ in range(options["repeat"])]
+            finally:
+                canvas_client.invalidate_cache(TOKEN)
+                canvas_client._http_cache, canvas_client._submission_store = saved_stores
+                canvas_client.close_sessions()
+
+        stages = {
+            name: {
+                "median": statistics.median(run[name] for run in runs),
+                "min": min(run[name] for run in runs),
+            }
+            for name in runs[0]
+        }
+        result = {
+            "label": options["label"] or _git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "json": payloads.BACKEND,
+            "numpy": columnar.available(),
+            "config": config,
+            "repeat": options["repeat"],
+            "calls": dict(canvas.calls),
+            "stages": stages,
+        }
+
+        output = Path(options["output"])
+        self._print(result, self._previous(output, config))
+
+        if not options["no_save"]:
+            output.parent.mkdir(parents=True, exist_ok=True)
+            with open(output, "a") as f:
+                f.write(json.dumps(result) + "\n")
+            self.stdout.write(f"Saved to {output}")
+
+    # --------------------------------------------------------
+    # Stages
+    # --------------------------------------------------------
+    def _run(self, canvas):
+        """One cold run of every stage; returns {stage: seconds}."""
+        canvas.refill()
+        canvas_client.invalidate_cache(TOKEN)
+        canvas_client._http_cache.invalidate(TOKEN)
+
+        base_url = canvas.base_url
+        start, end = canvas.start_date, canvas.end_date
+        timings = {}
+
+        def timed(name, func, *args):
+            t0 = time.perf_counter()
+            value = func(*args)
+            timings[name] = time.perf_counter() - t0
+            return value
+
+        def per_course(func):
+            with ThreadPoolExecutor(max_workers=canvas_client.COURSE_WORKERS) as pool:
+                return dict(zip(cids, pool.map(func, cids)))
+
+        courses = timed("courses", canvas_client.get_courses_by_ids, base_url, TOKEN, canvas.course_ids)
+        cids = [str(c["id"]) for c in courses]
+
+        students_map = timed("students", per_course, lambda cid: canvas_client.get_students(base_url, cid, TOKEN))
+        assignments_map = timed("assignments", per_course, lambda cid: canvas_client.filter_assignments_by_date(
+            canvas_client.get_assignments(base_url, cid, TOKEN), start, end
+        ))
+        submissions_map = timed("submissions", per_course, lambda cid: canvas_client.get_submissions(
+            base_url, cid, [a["id"] for a in assignments_map[cid]], TOKEN
+        ))
+
+        # The whole fetch pipeline again from cold caches, as the report view runs it
+        canvas_client.invalidate_cache(TOKEN)
+        canvas_client._http_cache.invalidate(TOKEN)
+        timed("fetch_course_data", canvas_client.fetch_course_data, base_url, TOKEN, courses, start, end)
+
+        maps = (courses, students_map, assignments_map, submissions_map)
+        report = timed("build_weekly_status", build_weekly_status, *maps)
+        if columnar.available():
+            timed("build_weekly_status_columnar", columnar.build_weekly_status_columnar, *maps)
+
+        statuses = [s for course in report["courses"] for s in course["students"]]
+        with open(SAMPLE_DEFAULTS) as f:
+            sample = json.load(f)
+        templates = {
+            "congrats": CompiledTemplate(sample["template_congrats"]),
+            "encourage": CompiledTemplate(sample["template_encourage"]),
+        }
+        messages = timed("generate_message", lambda: [generate_message(s, templates) for s in statuses])
+
+        timed("render", self._render, report)
+
+        outgoing = [
+            {"recipient_id": s["id"], "subject": "Benchmark", "body": m["message_body"]}
+            for s, m in zip(statuses, messages)
+        ]
+        timed("send", lambda: sender.send_messages(base_url, TOKEN, outgoing, bulk=True))
+
+        return timings
+
+    def _render(self, report):
+        """Dump the report for storage and render the report page, as WeeklyReportView does."""
+        view = WeeklyReportView()
+        data = records.dump_report(report)
+        for course, dumped in zip(report["courses"], data["courses"]):
+            view._prepare_card(course, dumped)
+        report["canvas_base_url"] = "https://canvas.example"
+        request = RequestFactory().get("/report/")
+        return render_to_string(view.template_name, {"weekly_report": report}, request)
+
+    # --------------------------------------------------------
+    # Results
+    # --------------------------------------------------------
+    def _previous(self, output, config):
+        """The last stored run with the same settings, or None."""
+        if not output.exists():
+            return None
+        previous = None
+        with open(output) as f:
+            for line in f:
+                try:
+                    run = json.loads(line)
+                except ValueError:
+                    continue
+                if run.get("config") == config:
+                    previous = run
+        return previous
+
+    def _print(self, result, previous):
+        config = ", ".join(f"{k}={v}" for k, v in result["config"].items())
+        self.stdout.write(f"{config} (repeat={result['repeat']}, json={result['json']})")
+        if previous:
+            self.stdout.write(f"Compared with {previous.get('label')} at {previous.get('timestamp')}")
+
+        self.stdout.write(f"{'stage':<30}{'median ms':>12}{'min ms':>12}{'prev ms':>12}{'change':>10}")
+        for name, stage in result["stages"].items():
+            line = f"{name:<30}{stage['median'] * 1000:>12.1f}{stage['min'] * 1000:>12.1f}"
+            before = (previous or {}).get("stages", {}).get(name)
+            if before and before["median"]:
+                change = stage["median"] / before["median"] - 1
+                line += f"{before['median'] * 1000:>12.1f}{change:>+10.0%}"
+                if change > REGRESSION_THRESHOLD:
+                    self.stdout.write(self.style.WARNING(line + "  slower"))
+                    continue
+            self.stdout.write(line)
+
+        calls = ", ".join(f"{k}={v}" for k, v in sorted(result["calls"].items()))
+        self.stdout.write(f"Fake Canvas calls: {calls}")
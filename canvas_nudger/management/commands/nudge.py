@@ -0,0 +1,185 @@
+"""
+Headless report-and-nudge run, for cron or batch use without the web UI.
+
+    python manage.py nudge --courses 101,102,103 --start 2026-02-01 --end 2026-02-08
+    python manage.py nudge --send --dry-run
+    python manage.py nudge --send --concurrency 8
+    python manage.py nudge --resume 42
+
+Canvas URL, token, courses and message templates default to
+canvas_nudger/.env/defaults.json. Sends go through the same send-job
+tables and journal as the web flow, so a rerun for the same period
+skips students who were already messaged.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from ... import canvas_client, columnar, jobs, records
+from ...defaults import load_defaults
+from ...workflow import MESSAGE_SUBJECTS, build_weekly_status, generate_messages
+
+OUTPUT_DIR = Path(__file__).resolve().parents[2] / ".env" / "nudge"
+
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def _parse_date(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}; use YYYY-MM-DD or 'YYYY-MM-DD HH:MM'")
+
+
+class Command(BaseCommand):
+    help = "Build the weekly report for a list of courses and optionally send the nudges."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--courses", help="Comma-separated course IDs (default: course_ids_raw from defaults.json)")
+        parser.add_argument("--start", help="Start of the period (default: 7 days before --end)")
+        parser.add_argument("--end", help="End of the period (default: today at midnight)")
+        parser.add_argument("--api-url", help="Canvas API URL (default: canvas_api_url from defaults.json)")
+        parser.add_argument("--token", help="Canvas API token (default: CANVAS_API_TOKEN, then defaults.json)")
+        parser.add_argument("--output", help=f"Report file to write (default: a file under {OUTPUT_DIR})")
+        parser.add_argument("--send", action="store_true", help="Send the generated messages")
+        parser.add_argument("--dry-run", action="store_true", help="With --send, show what would be sent without sending")
+        parser.add_argument(
+            "--include-completed",
+            action="store_true",
+            help="Also send congratulations to students with no missing work",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=canvas_client.COURSE_WORKERS,
+            help="Courses fetched at once, and messages in flight when sending",
+        )
+        parser.add_argument(
+            "--resume",
+            type=int,
+            metavar="JOB_ID",
+            help="Retry an earlier send job's unsent messages instead of building a report",
+        )
+
+    def handle(self, *args, **options):
+        defaults = load_defaults()
+        base_url = options["api_url"] or defaults.get("canvas_api_url")
+        token = options["token"] or os.environ.get("CANVAS_API_TOKEN") or defaults.get("api_token")
+        course_ids = [c.strip() for c in (options["courses"] or defaults.get("course_ids_raw", "")).split(",") if c.strip()]
+        if not base_url or not token:
+            raise CommandError("A Canvas API URL and token are required (options or defaults.json)")
+        if options["resume"] is not None:
+            self._resume(options["resume"], base_url, token, max(1, options["concurrency"]))
+            return
+        if not course_ids:
+            raise CommandError("No courses given; use --courses or set course_ids_raw in defaults.json")
+
+        # Whole days by default, so a rerun on the same day covers the
+        # same period and the send journal recognises its messages
+        end = _parse_date(options["end"]) if options["end"] else datetime.now().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        start = _parse_date(options["start"]) if options["start"] else end - timedelta(days=7)
+        week = f"{start.strftime(DATE_FORMAT)}/{end.strftime(DATE_FORMAT)}"
+        workers = max(1, options["concurrency"])
+
+        courses = canvas_client.get_courses_by_ids(base_url, token, course_ids)
+        for course in courses:
+            if course.get("error"):
+                self.stderr.write(self.style.WARNING(f"Skipping course {course['id']}: could not be fetched"))
+        courses = [c for c in courses if not c.get("error")]
+        if not courses:
+            raise CommandError("None of the courses could be fetched")
+
+        self.stdout.write(f"Fetching {len(courses)} course(s) for {week}")
+        students_map, assignments_map, submissions_map = canvas_client.fetch_course_data(
+            base_url, token, courses, start, end, max_workers=workers
+        )
+
+        if columnar.should_use(students_map, assignments_map):
+            build = columnar.build_weekly_status_columnar
+        else:
+            build = build_weekly_status
+        report = build(courses, students_map, assignments_map, submissions_map)
+
+        # Who gets a message: students with missing work, plus everyone
+        # else with --include-completed
+        selected = [
+            (course, student)
+            for course in report["courses"]
+            for student in course["students"]
+            if options["include_completed"] or not student["completed_all"]
+        ]
+        messages = generate_messages([student for _, student in selected])
+
+        items = []
+        for (course, student), msg in zip(selected, messages):
+            items.append({
+                "course_id": str(course["id"]),
+                "course_name": course["name"],
+                "student_id": str(student["id"]),
+                "student_name": student["name"],
+                "subject": MESSAGE_SUBJECTS.get(msg["message_type"], MESSAGE_SUBJECTS["encourage"]),
+                "body": msg["message_body"],
+            })
+
+        data = records.dump_report(report)
+        for course in data["courses"]:
+            s = course["summary"]
+            self.stdout.write(
+                f'{course["name"]}: {s["students"]} students, {s["completed"]} completed, '
+                f'{s["missing"]} missing work, {s["expired"]} with expired work'
+            )
+
+        job_id = None
+        if options["send"] and items:
+            if any(not item["body"].strip() for item in items):
+                raise CommandError("Message templates are empty; set them on the Message Templates page first")
+            if options["dry_run"]:
+                self.stdout.write(f"Dry run: would send {len(items)} message(s)")
+                for item in items[:10]:
+                    self.stdout.write(f'  {item["course_name"]} / {item["student_name"]}: {item["subject"]}')
+                if len(items) > 10:
+                    self.stdout.write(f"  ... and {len(items) - 10} more (all are in the report file)")
+            else:
+                job_id = jobs.submit_send_job(base_url, token, items, week, start=False)
+                self.stdout.write(f"Sending {len(items)} message(s) as send job {job_id}")
+                jobs.run_send_job(job_id, base_url, token, max_workers=workers)
+
+        output = Path(options["output"]) if options["output"] else (
+            OUTPUT_DIR / f'report-{start.strftime("%Y%m%d")}-{end.strftime("%Y%m%d")}.json'
+        )
+        self._write(output, {
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "start": start.strftime(DATE_FORMAT),
+            "end": end.strftime(DATE_FORMAT),
+            "report": data,
+            "messages": items,
+            "send_job": jobs.job_progress(job_id, full=True) if job_id else None,
+        })
+        self.stdout.write(f"Report written to {output}")
+
+        if job_id:
+            self._report_job(job_id)
+
+    def _resume(self, job_id, base_url, token, workers):
+        # Run in the foreground, like a fresh --send
+        if not jobs.resume_send_job(job_id, base_url, token, start=False):
+            raise CommandError(f"Send job {job_id} does not exist or is still being sent")
+        progress = jobs.job_progress(job_id)
+        self.stdout.write(f'Resuming send job {job_id}: {progress["total"] - progress["sent"]} unsent message(s)')
+        jobs.run_send_job(job_id, base_url, token, max_workers=workers)
+        self._report_job(job_id)
+
+    def _report_job(self, job_id):
+        progress = jobs.job_progress(job_id)
+        style = self.style.ERROR if progress["failed"] else self.style.SUCCESS
+        self.stdout.write(style(f'Sent {progress["sent"]}, failed {progress["failed"]} of {progress["total"]}'))
+
+    def _write(self, path, payload):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(payload, f, indent=2)
+        os.replace(tmp, path)
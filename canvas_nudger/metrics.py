@@ -0,0 +1,273 @@
+"""
+Lightweight instrumentation for Canvas API traffic and report stages.
+
+Every Canvas response is recorded by a requests hook on the pooled
+sessions: a call counter, latency histogram and byte count per endpoint,
+plus the rate-limit cost Canvas reports. Cache lookups and stage timers
+(build_weekly_status, message generation) are recorded the same way.
+
+Numbers go to a process-wide aggregate (see snapshot(), served as JSON by
+MetricsView) and, while a request is being handled, to a per-request
+collector that MetricsMiddleware turns into response headers.
+"""
+import contextvars
+import re
+import time
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_current = contextvars.ContextVar("canvas_nudger_metrics", default=None)
+
+_ID_SEGMENT = re.compile(r"/(\d+|sis_[^/]+)(?=/|$)")
+
+
+def endpoint_name(method, url):
+    """'GET /courses/:id/users' for 'GET https://host/api/v1/courses/123/users?page=2'."""
+    path = url.split("?", 1)[0]
+    path = re.sub(r"^https?://[^/]+", "", path)
+    path = re.sub(r"^/api/v\d+", "", path)
+    return f"{method} {_ID_SEGMENT.sub('/:id', path)}"
+
+
+class Metrics:
+    """Thread-safe counters for one scope (the process, or one request)."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.started = time.time()
+        self.endpoints = {}
+        self.cache = {"hits": 0, "misses": 0, "not_modified": 0}
+        self.rate_limit = {"cost": 0.0, "remaining": None}
+        self.stages = {}
+
+    def record_call(self, endpoint, status, seconds, size, cost=None, remaining=None):
+        ms = seconds * 1000
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {
+                    "calls": 0,
+                    "errors": 0,
+                    "bytes": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                }
+            stats["calls"] += 1
+            stats["errors"] += status >= 400
+            stats["bytes"] += size
+            stats["total_ms"] += ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+            stats["histogram"][_bucket(ms)] += 1
+
+            if status == 304:
+                self.cache["not_modified"] += 1
+            if cost is not None:
+                self.rate_limit["cost"] += cost
+            if remaining is not None:
+                self.rate_limit["remaining"] = remaining
+
+    def record_cache(self, hit):
+        with self._lock:
+            self.cache["hits" if hit else "misses"] += 1
+
+    def record_stage(self, name, seconds):
+        ms = seconds * 1000
+        with self._lock:
+            stats = self.stages.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["count"] += 1
+            stats["total_ms"] += ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+
+    def totals(self):
+        with self._lock:
+            return {
+                "calls": sum(s["calls"] for s in self.endpoints.values()),
+                "errors": sum(s["errors"] for s in self.endpoints.values()),
+                "bytes": sum(s["bytes"] for s in self.endpoints.values()),
+                "canvas_ms": sum(s["total_ms"] for s in self.endpoints.values()),
+                "cache_hits": self.cache["hits"],
+                "cache_misses": self.cache["misses"],
+                "not_modified": self.cache["not_modified"],
+                "rate_limit_cost": self.rate_limit["cost"],
+            }
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.cache["hits"] + self.cache["misses"]
+            return {
+                "since": self.started,
+                "latency_buckets_ms": list(LATENCY_BUCKETS_MS) + ["inf"],
+                "endpoints": {
+                    name: dict(stats, histogram=list(stats["histogram"]),
+                               avg_ms=stats["total_ms"] / stats["calls"])
+                    for name, stats in sorted(self.endpoints.items())
+                },
+                "cache": dict(self.cache, hit_rate=self.cache["hits"] / lookups if lookups else None),
+                "rate_limit": dict(self.rate_limit),
+                "stages": {name: dict(stats) for name, stats in sorted(self.stages.items())},
+            }
+
+
+def _bucket(ms):
+    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+        if ms <= bound:
+            return i
+    return len(LATENCY_BUCKETS_MS)
+
+
+# Process-wide aggregate since startup (or the last reset)
+_global = Metrics()
+_global_lock = Lock()
+
+
+def _scopes():
+    current = _current.get()
+    return (_global, current) if current is not None else (_global,)
+
+
+def record_call(*args, **kwargs):
+    for scope in _scopes():
+        scope.record_call(*args, **kwargs)
+
+
+def record_cache(hit):
+    for scope in _scopes():
+        scope.record_cache(hit)
+
+
+def record_stage(name, seconds):
+    for scope in _scopes():
+        scope.record_stage(name, seconds)
+
+
+def snapshot():
+    return _global.snapshot()
+
+
+def reset():
+    global _global
+    with _global_lock:
+        _global = Metrics()
+
+
+# ------------------------------------------------------------
+# Per-request scope
+# ------------------------------------------------------------
+def begin_request():
+    """Start collecting for the current request; returns (collector, token)."""
+    collector = Metrics()
+    return collector, _current.set(collector)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current():
+    """The current request's collector, or None outside a request."""
+    return _current.get()
+
+
+@contextmanager
+def collecting(collector):
+    """
+    Record into collector inside the block, e.g. while a streamed body
+    is generated after MetricsMiddleware has already returned.
+    """
+    previous = _current.get()
+    _current.set(collector)
+    try:
+        yield collector
+    finally:
+        _current.set(previous)
+
+
+def bind(func):
+    """
+    Wrap func to run in a copy of the caller's context, so calls made on
+    pool threads are still counted against the request that started them.
+    """
+    context = contextvars.copy_context()
+
+    @wraps(func)
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(func, *args, **kwargs)
+
+    return run
+
+
+# ------------------------------------------------------------
+# Stage timers
+# ------------------------------------------------------------
+@contextmanager
+def stage(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - t0)
+
+
+def timed(name):
+    """Decorator form of stage()."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ------------------------------------------------------------
+# requests hook
+# ------------------------------------------------------------
+def _float(headers, name):
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def response_hook(resp, *args, **kwargs):
+    """requests 'response' hook: record one Canvas call."""
+    t0 = time.perf_counter()
+    size = len(resp.content)  # read the body here so it counts toward latency
+    seconds = resp.elapsed.total_seconds() + (time.perf_counter() - t0)
+    record_call(
+        endpoint_name(resp.request.method, resp.request.url),
+        resp.status_code,
+        seconds,
+        size,
+        cost=_float(resp.headers, "X-Request-Cost"),
+        remaining=_float(resp.headers, "X-Rate-Limit-Remaining"),
+    )
+    return resp
+
+
+def server_timing(collector):
+    """Server-Timing header value for one request's collector."""
+    totals = collector.totals()
+    parts = [
+        f'canvas;dur={totals["canvas_ms"]:.1f};desc="{totals["calls"]} Canvas calls"',
+    ]
+    for name, stats in collector.snapshot()["stages"].items():
+        parts.append(f"{name};dur={stats['total_ms']:.1f}")
+    return ", ".join(parts)
+
+
+def summary_header(collector):
+    """Compact X-Canvas-Metrics header value for one request's collector."""
+    totals = collector.totals()
+    return (
+        f'calls={totals["calls"]}; errors={totals["errors"]}; canvas_ms={totals["canvas_ms"]:.0f}; '
+        f'bytes={totals["bytes"]}; cache_hits={totals["cache_hits"]}; '
+        f'cache_misses={totals["cache_misses"]}; not_modified={totals["not_modified"]}; '
+        f'rate_limit_cost={totals["rate_limit_cost"]:.1f}'
+    )
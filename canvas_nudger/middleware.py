@@ -0,0 +1,45 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from . import metrics
+
+
+class MetricsMiddleware:
+    """
+    Collect Canvas call and stage metrics for each request and report them
+    in Server-Timing and X-Canvas-Metrics response headers.
+
+    Streamed responses send their headers before the body is built, so
+    for those the headers only cover the work done before streaming began;
+    WeeklyReportView keeps recording into the collector while it streams
+    and shows the totals in a DEBUG footer.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        collector, token = metrics.begin_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self._annotate(response, collector)
+
+    async def __acall__(self, request):
+        collector, token = metrics.begin_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self._annotate(response, collector)
+
+    def _annotate(self, response, collector):
+        response["Server-Timing"] = metrics.server_timing(collector)
+        response["X-Canvas-Metrics"] = metrics.summary_header(collector)
+        return response
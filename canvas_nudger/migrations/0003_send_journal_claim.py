@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-17 15:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canvas_nudger', '0002_send_journal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sendjournalentry',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='canvas_nudger.sendjob'),
+        ),
+        migrations.AlterField(
+            model_name='sendjournalentry',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canvas_nudger', '0003_send_journal_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sendjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,3 +1,97 @@
 from django.db import models
 
-# Create your models here.
+
+class SendJob(models.Model):
+    """A batch of inbox messages sent in the background (see jobs.py)."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    total = models.PositiveIntegerField(default=0)
+    # Refreshed while a process is working on the job; cleared when it stops
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Send job {self.pk} ({self.status})"
+
+
+class SendJobMessage(models.Model):
+    QUEUED = "queued"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    job = models.ForeignKey(SendJob, on_delete=models.CASCADE, related_name="messages")
+    position = models.PositiveIntegerField()
+    course_id = models.CharField(max_length=32)
+    course_name = models.CharField(max_length=255)
+    student_id = models.CharField(max_length=32)
+    student_name = models.CharField(max_length=255)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    error = models.TextField(blank=True, default="")
+    idempotency_key = models.CharField(max_length=64, db_index=True)
+
+    class Meta:
+        ordering = ["job", "position"]
+
+    def as_report_row(self):
+        """The sent_report shape used by messages_sent.html."""
+        return {
+            "position": self.position,
+            "course_name": self.course_name,
+            "student_name": self.student_name,
+            "message_body": self.body,
+            "status": self.status,
+            "error": self.error or None,
+        }
+
+
+class SendJournalEntry(models.Model):
+    """
+    One row per message that should be delivered at most once, keyed by
+    (course, student, week, body hash). A job claims an entry (pending or
+    failed -> sending) before sending it, so two jobs holding the same
+    message never both send it, and a sent entry is never reopened. Only
+    a send cut off before its result was recorded is retried, once the
+    job that claimed it is resumed or its heartbeat has lapsed.
+    """
+
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENDING, "Sending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    idempotency_key = models.CharField(max_length=64, unique=True)
+    course_id = models.CharField(max_length=32)
+    student_id = models.CharField(max_length=32)
+    week = models.CharField(max_length=64)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    claimed_by = models.ForeignKey(SendJob, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.course_id}:{self.student_id} {self.week} ({self.status})"
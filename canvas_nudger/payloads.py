@@ -0,0 +1,68 @@
+"""
+Decoding and trimming of Canvas JSON payloads.
+
+Uses orjson when it is installed and the stdlib json module otherwise.
+List endpoints are projected at ingest down to the fields the report and
+messages actually read, so descriptions, rubrics, attachments and
+submission histories never reach the caches.
+"""
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+
+ASSIGNMENT_FIELDS = ("id", "name", "due_at", "lock_at", "html_url")
+# assignment_id is needed to regroup bulk results by assignment
+SUBMISSION_FIELDS = ("id", "assignment_id", "user_id", "submitted_at", "score", "excused")
+USER_FIELDS = ("id", "name")
+
+# (path pattern, fields). First match wins, same as cache.DEFAULT_TTLS.
+PROJECTIONS = [
+    (re.compile(r"/submissions$"), SUBMISSION_FIELDS),
+    (re.compile(r"/assignments$"), ASSIGNMENT_FIELDS),
+    (re.compile(r"/users$"), USER_FIELDS),
+]
+
+
+def loads(data):
+    """Decode JSON from bytes or str."""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Compact JSON text."""
+    if orjson:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def fields_for(url):
+    """Fields to keep for records from url, or None to keep everything."""
+    path = url.split("?", 1)[0]
+    for pattern, fields in PROJECTIONS:
+        if pattern.search(path):
+            return fields
+    return None
+
+
+def project(data, fields):
+    """Keep only fields in each record of a list response (or a single record)."""
+    if fields is None:
+        return data
+    if isinstance(data, list):
+        return [{k: r[k] for k in fields if k in r} for r in data]
+    if isinstance(data, dict):
+        return {k: data[k] for k in fields if k in data}
+    return data
+
+
+def decode(url, body):
+    """Decode a response body from url and project it."""
+    return project(loads(body), fields_for(url))
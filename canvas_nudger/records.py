@@ -0,0 +1,154 @@
+"""
+Compact report records. A weekly report only needs a handful of fields
+from each Canvas assignment, so assignments are reduced to AssignmentRow
+once per course and every student row points at those shared objects.
+"""
+
+from .dates import display_date
+
+# One character per assignment in a student's status string
+COMPLETED, MISSING, EXPIRED = "C", "M", "E"
+
+
+class _Record:
+    """Slotted record that also answers dict-style lookups (rec["name"], rec.get("id"))."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={getattr(self, k)!r}" for k in self.__slots__[:2])
+        return f"{type(self).__name__}({fields})"
+
+
+class AssignmentRow(_Record):
+    __slots__ = ("id", "name", "due_at", "lock_at", "html_url", "due_display", "lock_display")
+
+    def __init__(self, id, name, due_at=None, lock_at=None, html_url=None, due_display=None, lock_display=None):
+        self.id = id
+        self.name = name
+        self.due_at = due_at
+        self.lock_at = lock_at
+        self.html_url = html_url
+        self.due_display = due_display or display_date(due_at)
+        self.lock_display = lock_display or display_date(lock_at)
+
+    @classmethod
+    def from_canvas(cls, assignment):
+        return cls(
+            assignment["id"],
+            assignment.get("name"),
+            assignment.get("due_at"),
+            assignment.get("lock_at"),
+            assignment.get("html_url"),
+            assignment.get("due_display"),
+            assignment.get("lock_display"),
+        )
+
+    def to_list(self):
+        return [
+            self.id,
+            self.name,
+            self.due_at,
+            self.lock_at,
+            self.html_url,
+            self.due_display,
+            self.lock_display,
+        ]
+
+
+class StudentRow(_Record):
+    __slots__ = (
+        "id",
+        "name",
+        "completed_all",
+        "completed_assignments",
+        "missing_assignments",
+        "expired_assignments",
+    )
+
+    def __init__(self, id, name, completed, missing, expired):
+        self.id = id
+        self.name = name
+        self.completed_all = len(missing) == 0
+        self.completed_assignments = completed
+        self.missing_assignments = missing
+        self.expired_assignments = expired
+
+    @classmethod
+    def from_codes(cls, id, name, codes, assignments):
+        lists = {COMPLETED: [], MISSING: [], EXPIRED: []}
+        for code, assignment in zip(codes, assignments):
+            lists[code].append(assignment)
+        return cls(id, name, lists[COMPLETED], lists[MISSING], lists[EXPIRED])
+
+    def status_codes(self, positions):
+        """Encode this row as one status character per course assignment."""
+        codes = [COMPLETED] * len(positions)
+        for code, rows in ((MISSING, self.missing_assignments), (EXPIRED, self.expired_assignments)):
+            for a in rows:
+                codes[positions[id(a)]] = code
+        return "".join(codes)
+
+
+def course_summary(codes):
+    """Per-course counts from the students' status strings."""
+    missing = sum(1 for c in codes if MISSING in c)
+    return {
+        "students": len(codes),
+        "completed": len(codes) - missing,
+        "missing": missing,
+        "expired": sum(1 for c in codes if EXPIRED in c),
+    }
+
+
+def dump_course(course):
+    """Compact form of one report course, with its summary counts."""
+    assignments = course["assignments"]
+    positions = {id(a): j for j, a in enumerate(assignments)}
+    students = [[s["id"], s["name"], s.status_codes(positions)] for s in course["students"]]
+    return {
+        "id": course["id"],
+        "name": course["name"],
+        "assignments": [a.to_list() for a in assignments],
+        "students": students,
+        "summary": course_summary([codes for _, _, codes in students]),
+    }
+
+
+def dump_report(report):
+    """
+    Compact, JSON-friendly form of a weekly report: each course lists its
+    assignments once and each student is [id, name, status codes].
+    """
+    data = {k: v for k, v in report.items() if k != "courses"}
+    data["courses"] = [dump_course(course) for course in report["courses"]]
+    return data
+
+
+def load_report(data):
+    """Rebuild report records from dump_report output."""
+    report = {k: v for k, v in data.items() if k != "courses"}
+    report["courses"] = []
+
+    for course in data["courses"]:
+        assignments = [AssignmentRow(*a) for a in course["assignments"]]
+        report["courses"].append({
+            "id": course["id"],
+            "name": course["name"],
+            "assignments": assignments,
+            "students": [
+                StudentRow.from_codes(sid, name, codes, assignments)
+                for sid, name, codes in course["students"]
+            ],
+            "summary": course.get("summary"),
+        })
+
+    return report
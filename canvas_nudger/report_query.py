@@ -0,0 +1,67 @@
+"""
+Paging, sorting and filtering over a stored weekly report (the output of
+records.dump_report). Students are matched on their compact status
+strings and StudentRow objects are only built for the page being shown,
+so a page costs about the same for 30 students as for 3,000.
+"""
+from django.core.paginator import Paginator
+from .records import MISSING, AssignmentRow, StudentRow
+
+PAGE_SIZE = 50
+
+# Rows are (course index, student id, name, status codes). Python's sort
+# is stable, so "course" keeps each roster in its original order.
+SORTS = {
+    "course": lambda row: row[0],
+    "name": lambda row: (str(row[2] or "").lower(), row[0]),
+    "missing": lambda row: (-row[3].count(MISSING), str(row[2] or "").lower()),
+}
+DEFAULT_SORT = "course"
+
+
+def parse_filters(params):
+    """Read q / course / only_missing / sort from a QueryDict."""
+    sort = params.get("sort", DEFAULT_SORT)
+    return {
+        "q": params.get("q", "").strip(),
+        "course": params.get("course", "").strip(),
+        "only_missing": params.get("only_missing") in ("1", "on", "true"),
+        "sort": sort if sort in SORTS else DEFAULT_SORT,
+    }
+
+
+def matching_rows(data, filters):
+    """Every student row in the stored report that passes filters, sorted."""
+    q = filters["q"].lower()
+    rows = []
+
+    for i, course in enumerate(data["courses"]):
+        if filters["course"] and str(course["id"]) != filters["course"]:
+            continue
+        for sid, name, codes in course["students"]:
+            if filters["only_missing"] and MISSING not in codes:
+                continue
+            if q and q not in str(name or "").lower():
+                continue
+            rows.append((i, sid, name, codes))
+
+    rows.sort(key=SORTS[filters["sort"]])
+    return rows
+
+
+def report_page(data, filters, page_number=1, per_page=PAGE_SIZE):
+    """
+    Return (page, rows) where page is a Django Page of matching rows and
+    rows holds (course, StudentRow) for just the students on that page.
+    """
+    page = Paginator(matching_rows(data, filters), per_page).get_page(page_number)
+
+    assignments = {}
+    rows = []
+    for i, sid, name, codes in page.object_list:
+        course = data["courses"][i]
+        if i not in assignments:
+            assignments[i] = [AssignmentRow(*a) for a in course["assignments"]]
+        rows.append((course, StudentRow.from_codes(sid, name, codes, assignments[i])))
+
+    return page, rows
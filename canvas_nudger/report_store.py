@@ -0,0 +1,57 @@
+"""
+Server-side storage for weekly reports, pending messages and send
+results. The session only carries the short IDs returned by save(), so
+each request no longer decodes and rewrites a large session row.
+"""
+from uuid import uuid4
+from django.core.cache import caches
+
+# Cache alias configured in settings.CACHES
+CACHE_ALIAS = "reports"
+
+# Keep stored items for a day
+TIMEOUT = 24 * 60 * 60
+
+
+def _store():
+    return caches[CACHE_ALIAS]
+
+
+def new_id():
+    return uuid4().hex
+
+
+def save(data, item_id=None):
+    """Store data and return its ID; a new one unless item_id is given."""
+    item_id = item_id or new_id()
+    _store().set(item_id, data, TIMEOUT)
+    return item_id
+
+
+def load(item_id):
+    """Return the stored data, or None if the ID is missing or expired."""
+    if not item_id:
+        return None
+    return _store().get(item_id)
+
+
+def delete(item_id):
+    if item_id:
+        _store().delete(item_id)
+
+
+async def asave(data, item_id=None):
+    item_id = item_id or new_id()
+    await _store().aset(item_id, data, TIMEOUT)
+    return item_id
+
+
+async def aload(item_id):
+    if not item_id:
+        return None
+    return await _store().aget(item_id)
+
+
+async def adelete(item_id):
+    if item_id:
+        await _store().adelete(item_id)
@@ -0,0 +1,193 @@
+"""
+Parallel Canvas inbox sender that adapts to Canvas rate limiting.
+
+Canvas meters API use with a per-token bucket and reports what is left in
+X-Rate-Limit-Remaining, and what the last request took in X-Request-Cost.
+Concurrency is raised while the bucket can cover the requests in flight
+and halved when it runs low or Canvas answers 403 (Rate Limit Exceeded).
+Throttled and 5xx responses are retried with exponential backoff.
+
+In bulk mode, messages with the same subject and body are sent as one
+bulk_message POST, and recipients fall back to individual sends if it fails.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Condition
+import requests
+from . import canvas_client, metrics
+
+# Upper bound on messages in flight at once
+MAX_WORKERS = 8
+
+# Retries per message for throttling and server errors
+MAX_RETRIES = 4
+
+# Base backoff in seconds, doubled on each retry
+BACKOFF = 1.0
+
+# Canvas sends bulk messages synchronously up to this many recipients
+BULK_MAX_RECIPIENTS = 100
+
+# X-Rate-Limit-Remaining thresholds for slowing down / speeding up
+LOW_WATER = 150
+HIGH_WATER = 400
+
+# Rounds of in-flight requests, at the reported X-Request-Cost, the
+# bucket should still be able to pay for
+COST_HEADROOM = 2
+
+
+class AdaptiveLimit:
+    """A concurrency gate whose limit moves with Canvas rate-limit feedback."""
+
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = maximum
+        self.active = 0
+        self._cond = Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def observe(self, remaining, cost=None):
+        if remaining is None:
+            return
+        with self._cond:
+            low, high = LOW_WATER, HIGH_WATER
+            if cost:
+                # Expensive requests drain the bucket faster than the fixed
+                # marks assume, so scale them with what is in flight, and
+                # only grow with room for one more slot twice over
+                low = max(low, cost * self.limit * COST_HEADROOM)
+                high = max(high, cost * (self.limit + 1) * COST_HEADROOM * 2)
+            if remaining < low:
+                self.limit = max(1, self.limit // 2)
+            elif remaining > high and self.limit < self.maximum:
+                self.limit += 1
+                self._cond.notify_all()
+
+    def throttled(self):
+        with self._cond:
+            self.limit = max(1, self.limit // 2)
+
+
+def _is_throttled(result):
+    status = result.get("status_code")
+    if status == 429:
+        return True
+    return status == 403 and "rate limit" in (result.get("error") or "").lower()
+
+
+def _is_retryable(result):
+    status = result.get("status_code")
+    return _is_throttled(result) or (status is not None and status >= 500)
+
+
+def _backoff(attempt, retry_after=None):
+    delay = retry_after if retry_after else BACKOFF * (2 ** attempt)
+    time.sleep(delay + random.uniform(0, BACKOFF / 2))
+
+
+def _send_with_retry(gate, send):
+    """Call send() through the gate, retrying throttled and 5xx responses."""
+    for attempt in range(MAX_RETRIES + 1):
+        with gate:
+            try:
+                result = send()
+            except requests.RequestException as exc:
+                result = {"success": False, "error": str(exc), "status_code": 503}
+
+        gate.observe(result.get("rate_limit_remaining"), result.get("request_cost"))
+        if result["success"] or not _is_retryable(result) or attempt == MAX_RETRIES:
+            result["attempts"] = attempt + 1
+            return result
+
+        if _is_throttled(result):
+            gate.throttled()
+        _backoff(attempt, result.get("retry_after"))
+
+
+def send_one(base_url, token, message, gate):
+    return _send_with_retry(gate, lambda: canvas_client.send_inbox_message(
+        base_url=base_url,
+        token=token,
+        recipient_id=message["recipient_id"],
+        subject=message["subject"],
+        body=message["body"],
+    ))
+
+
+def send_group(base_url, token, group, gate):
+    """
+    Send messages that share a subject and body in one bulk POST.
+    Returns one result per message; if the bulk call fails, each
+    recipient is retried on its own so failures stay per-student.
+    """
+    if len(group) == 1:
+        return [send_one(base_url, token, group[0], gate)]
+
+    first = group[0]
+    result = _send_with_retry(gate, lambda: canvas_client.send_bulk_inbox_message(
+        base_url=base_url,
+        token=token,
+        recipient_ids=[m["recipient_id"] for m in group],
+        subject=first["subject"],
+        body=first["body"],
+    ))
+    if result["success"]:
+        return [dict(result, bulk_size=len(group)) for _ in group]
+
+    return [send_one(base_url, token, m, gate) for m in group]
+
+
+def group_messages(messages):
+    """Group message indexes by identical (subject, body), in chunks Canvas accepts."""
+    groups = {}
+    for i, m in enumerate(messages):
+        groups.setdefault((m["subject"], m["body"]), []).append(i)
+
+    chunks = []
+    for indexes in groups.values():
+        for start in range(0, len(indexes), BULK_MAX_RECIPIENTS):
+            chunks.append(indexes[start:start + BULK_MAX_RECIPIENTS])
+    return chunks
+
+
+def send_messages(base_url, token, messages, max_workers=None, bulk=False, on_result=None):
+    """
+    Send many inbox messages concurrently.
+
+    messages: list of {"recipient_id", "subject", "body"} dicts.
+    Returns one send_inbox_message-style result per message, in order.
+    With bulk=True, identical messages share one bulk POST. on_result, if
+    given, is called as on_result(index, result) from the calling thread
+    as each message finishes.
+    """
+    workers = max_workers or MAX_WORKERS
+    gate = AdaptiveLimit(workers)
+    chunks = group_messages(messages) if bulk else [[i] for i in range(len(messages))]
+    results = [None] * len(messages)
+
+    send = metrics.bind(send_group)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(send, base_url, token, [messages[i] for i in chunk], gate): chunk
+            for chunk in chunks
+        }
+        for future in as_completed(futures):
+            for i, result in zip(futures[future], future.result()):
+                results[i] = result
+                if on_result:
+                    on_result(i, result)
+
+    return results
@@ -1,5 +1,5 @@
-from datetime import datetime
 from django import template
+from ..dates import display_date
 
 register = template.Library()
 
@@ -13,13 +13,7 @@ def dict_get(d, key):
 @register.filter
 def pretty_date(value):
     """Convert Canvas ISO8601 date to 'Feb 7, 2026'."""
-    if not value:
-        return "Unknown"
-    try:
-        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
-        return dt.strftime("%b %d, %Y")
-    except Exception:
-        return value  # fallback
+    return display_date(value)
     
 @register.filter(name="add_class")
 def add_class(field, css_class):
@@ -1,3 +1,751 @@
-from django.test import TestCase
+import asyncio
+import json
+import re
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from io import StringIO
+from unittest import mock, skipUnless
+import requests
+from pytz import utc
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from . import canvas_client, columnar, defaults, jobs, metrics, report_query, report_store, sender, workflow
+from .cache import HttpCache, ResponseCache, SubmissionStore, make_key
+from .fakecanvas import FakeCanvas
+from .models import SendJob, SendJobMessage, SendJournalEntry
+from .views import WeeklyReportView
+from .workflow import CompiledTemplate, build_weekly_status
 
-# Create your tests here.
+TOKEN = "test-token"
+
+# Keep stored reports out of canvas_nudger/.env
+TEST_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "reports": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "reports"},
+}
+
+
+def baseline_weekly_status(courses, students_map, assignments_map, submissions_map):
+    """
+    The original report algorithm: scan every submission for every
+    (student, assignment) pair. Slow, but obviously right.
+    """
+    now = datetime.now(utc)
+    report = []
+    for course in courses:
+        cid = str(course["id"])
+        students = []
+        for student in students_map[cid]:
+            lists = {"completed": [], "missing": [], "expired": []}
+            for assignment in assignments_map[cid]:
+                subs = submissions_map[cid].get(str(assignment["id"]), [])
+                sub = next((s for s in subs if str(s.get("user_id")) == str(student["id"])), None)
+                score = sub.get("score") if sub else None
+                submitted = sub and (
+                    sub.get("submitted_at") or (score is not None and score > 0) or sub.get("excused", False)
+                )
+                lock_at = assignment.get("lock_at")
+                locked = bool(lock_at) and now > datetime.fromisoformat(lock_at.replace("Z", "+00:00"))
+                key = "completed" if submitted else "expired" if locked else "missing"
+                lists[key].append(assignment["id"])
+            students.append((student["id"], student.get("name"), lists["completed"], lists["missing"], lists["expired"]))
+        report.append((cid, course["name"], students))
+    return report
+
+
+def summarize(report):
+    """A report reduced to plain IDs, for comparing engines."""
+    return [
+        (
+            course["id"],
+            course["name"],
+            [
+                (
+                    s["id"],
+                    s["name"],
+                    [a["id"] for a in s["completed_assignments"]],
+                    [a["id"] for a in s["missing_assignments"]],
+                    [a["id"] for a in s["expired_assignments"]],
+                )
+                for s in course["students"]
+            ],
+        )
+        for course in report["courses"]
+    ]
+
+
+class FakeCanvasMixin:
+    """Run each test against its own FakeCanvas, with throwaway disk caches."""
+
+    canvas_options = {}
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for name, store in (
+            ("_http_cache", HttpCache(Path(tmp.name) / "http_cache.sqlite3")),
+            ("_submission_store", SubmissionStore(Path(tmp.name) / "submissions.sqlite3")),
+        ):
+            patcher = mock.patch.object(canvas_client, name, store)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.canvas = FakeCanvas(**self.canvas_options).start()
+        self.addCleanup(self.canvas.stop)
+        self.addCleanup(canvas_client.close_sessions)
+        self.addCleanup(canvas_client.invalidate_cache)
+
+    def fetch(self):
+        courses = canvas_client.get_courses_by_ids(self.canvas.base_url, TOKEN, self.canvas.course_ids)
+        maps = canvas_client.fetch_course_data(
+            self.canvas.base_url, TOKEN, courses, self.canvas.start_date, self.canvas.end_date
+        )
+        return (courses, *maps)
+
+
+class WeeklyStatusTests(FakeCanvasMixin, SimpleTestCase):
+    canvas_options = {"courses": 2, "students": 40, "assignments": 9}
+
+    def test_matches_baseline(self):
+        data = self.fetch()
+        report = build_weekly_status(*data)
+        self.assertEqual(summarize(report), baseline_weekly_status(*data))
+
+        # Completed, missing and expired all occur, so the comparison means something
+        students = [s for _, _, course_students in summarize(report) for s in course_students]
+        for column in (2, 3, 4):
+            self.assertTrue(any(s[column] for s in students))
+
+    @skipUnless(columnar.available(), "NumPy is not installed")
+    def test_columnar_matches_baseline(self):
+        data = self.fetch()
+        report = columnar.build_weekly_status_columnar(*data)
+        self.assertEqual(summarize(report), baseline_weekly_status(*data))
+
+
+class PaginationTests(FakeCanvasMixin, SimpleTestCase):
+    canvas_options = {"courses": 1, "students": 237, "max_per_page": 10}
+
+    def test_pages_are_complete_and_in_order(self):
+        cid = self.canvas.course_ids[0]
+        students = canvas_client.get_students(self.canvas.base_url, cid, TOKEN)
+
+        expected = [s["id"] for s in self.canvas.course(cid)[1]]
+        self.assertEqual([s["id"] for s in students], expected)
+        self.assertEqual(self.canvas.calls["users"], 24)
+
+    def test_not_modified_pages_are_reused(self):
+        cid = self.canvas.course_ids[0]
+        first = canvas_client.get_students(self.canvas.base_url, cid, TOKEN)
+
+        # Drop the in-memory copy so the pages are revalidated against Canvas
+        canvas_client._api_cache.invalidate(TOKEN)
+        collector, token = metrics.begin_request()
+        try:
+            second = canvas_client.get_students(self.canvas.base_url, cid, TOKEN)
+        finally:
+            metrics.end_request(token)
+
+        self.assertEqual(second, first)
+        self.assertEqual(collector.cache["not_modified"], 24)
+        self.assertEqual(self.canvas.calls["users"], 48)
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("canvas_nudger.cache.time")
+        self.clock = patcher.start()
+        self.clock.monotonic.return_value = 1000.0
+        self.addCleanup(patcher.stop)
+
+    def test_entries_expire_after_their_endpoint_ttl(self):
+        cache = ResponseCache()
+        submissions = make_key(TOKEN, "https://canvas/api/v1/courses/1/students/submissions")
+        users = make_key(TOKEN, "https://canvas/api/v1/courses/1/users")
+        cache.set(submissions, [1])
+        cache.set(users, [2])
+
+        self.clock.monotonic.return_value += 121
+        self.assertEqual(cache.get(submissions), (False, None))
+        self.assertEqual(cache.get(users), (True, [2]))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_evicts_least_recently_used_by_count(self):
+        cache = ResponseCache(max_entries=2)
+        keys = [make_key(TOKEN, f"https://canvas/api/v1/courses/{i}") for i in range(3)]
+        cache.set(keys[0], "a")
+        cache.set(keys[1], "b")
+        cache.get(keys[0])
+        cache.set(keys[2], "c")
+
+        self.assertEqual([cache.get(k)[0] for k in keys], [True, False, True])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_evicts_by_size(self):
+        cache = ResponseCache(max_bytes=250)
+        keys = [make_key(TOKEN, f"https://canvas/api/v1/courses/{i}") for i in range(3)]
+        for key in keys:
+            cache.set(key, "x" * 100)
+
+        self.assertEqual([cache.get(k)[0] for k in keys], [False, True, True])
+        self.assertLessEqual(cache.stats()["bytes"], 250)
+
+        # Too big to ever fit, so not cached at all
+        big = make_key(TOKEN, "https://canvas/api/v1/courses/big")
+        cache.set(big, "x" * 300)
+        self.assertEqual(cache.get(big), (False, None))
+        self.assertEqual(cache.stats()["entries"], 2)
+
+    def test_tokens_do_not_share_entries(self):
+        cache = ResponseCache()
+        url = "https://canvas/api/v1/courses/1"
+        cache.set(make_key("token-a", url), "a")
+        cache.set(make_key("token-b", url), "b")
+        self.assertEqual(cache.get(make_key("token-a", url)), (True, "a"))
+
+        cache.invalidate("token-a")
+        self.assertEqual(cache.get(make_key("token-a", url)), (False, None))
+        self.assertEqual(cache.get(make_key("token-b", url)), (True, "b"))
+
+
+class DefaultsStoreTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "defaults.json"
+
+    def test_concurrent_updates_keep_every_key(self):
+        # One store per thread, like separate workers sharing the file
+        def worker(n):
+            store = defaults.DefaultsStore(self.path)
+            for i in range(20):
+                store.update({f"worker{n}_{i}": i})
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        data = defaults.DefaultsStore(self.path).load()
+        self.assertEqual(len(data), 80)
+        self.assertEqual(data["worker3_19"], 19)
+
+    def test_sees_writes_from_another_store(self):
+        first = defaults.DefaultsStore(self.path)
+        second = defaults.DefaultsStore(self.path)
+        first.save({"email": "a@example.com"})
+        version = second.version()
+        self.assertEqual(second.load(), {"email": "a@example.com"})
+
+        first.update({"cc_email": "b@example.com"})
+        self.assertNotEqual(second.version(), version)
+        self.assertEqual(second.load(), {"email": "a@example.com", "cc_email": "b@example.com"})
+
+
+class SubmissionSyncTests(FakeCanvasMixin, SimpleTestCase):
+    canvas_options = {"courses": 1, "students": 20, "assignments": 8}
+
+    def setUp(self):
+        super().setUp()
+        self.cid = self.canvas.course_ids[0]
+        self.ids = [str(a["id"]) for a in self.canvas.course(self.cid)[2]]
+
+    def sync(self, ids):
+        """Run sync_submissions, returning its result and the params of each Canvas query."""
+        with mock.patch.object(canvas_client, "get_all", wraps=canvas_client.get_all) as get_all:
+            result = canvas_client.sync_submissions(self.canvas.base_url, self.cid, ids, TOKEN)
+        return result, [call.args[3] for call in get_all.call_args_list]
+
+    def expected(self, ids):
+        return canvas_client.get_submissions_bulk(self.canvas.base_url, self.cid, ids, TOKEN)
+
+    def test_first_sync_seeds_only_the_requested_assignments(self):
+        result, queries = self.sync(self.ids[:3])
+
+        self.assertEqual([q.get("assignment_ids[]") for q in queries], [self.ids[:3]])
+        self.assertEqual(result, self.expected(self.ids[:3]))
+        self.assertEqual(canvas_client._submission_store.seeded(TOKEN, self.cid), set(self.ids[:3]))
+
+    def test_wider_range_seeds_only_the_new_assignments(self):
+        self.sync(self.ids[:3])
+        result, queries = self.sync(self.ids[:6])
+
+        seeds = [q["assignment_ids[]"] for q in queries if "assignment_ids[]" in q]
+        self.assertEqual(seeds, [self.ids[3:6]])
+        self.assertEqual(sum("submitted_since" in q or "graded_since" in q for q in queries), 2)
+        self.assertEqual(result, self.expected(self.ids[:6]))
+
+        # Nothing left to seed, so only the changes are asked for
+        _, queries = self.sync(self.ids[:6])
+        self.assertFalse(any("assignment_ids[]" in q for q in queries))
+
+    def test_stale_course_is_seeded_again(self):
+        self.sync(self.ids[:4])
+        with mock.patch.object(canvas_client, "FULL_SYNC_MAX_AGE", -1):
+            result, queries = self.sync(self.ids[2:5])
+
+        self.assertEqual([q.get("assignment_ids[]") for q in queries], [self.ids[2:5]])
+        self.assertEqual(result, self.expected(self.ids[2:5]))
+        self.assertEqual(canvas_client._submission_store.seeded(TOKEN, self.cid), set(self.ids[2:5]))
+
+    def test_changes_replace_stored_submissions(self):
+        store = canvas_client._submission_store
+        subs = [{"assignment_id": 1, "user_id": 7, "score": None}, {"assignment_id": 1, "user_id": 8, "score": None}]
+        store.save(TOKEN, self.cid, subs, "2026-01-01T00:00:00Z", seeded=["1"], full=True)
+        store.save(TOKEN, self.cid, [{"assignment_id": 1, "user_id": 7, "score": 9}], "2026-01-02T00:00:00Z")
+
+        self.assertEqual(store.last_sync(TOKEN, self.cid)[0], "2026-01-02T00:00:00Z")
+        self.assertEqual(
+            sorted((s["user_id"], s["score"]) for s in store.load(TOKEN, self.cid, ["1"])["1"]),
+            [(7, 9), (8, None)],
+        )
+
+
+class TransportTests(FakeCanvasMixin, SimpleTestCase):
+    canvas_options = {"courses": 1, "students": 3, "latency": 0.5}
+
+    def test_stalled_calls_time_out(self):
+        with mock.patch.object(canvas_client, "TIMEOUT", (5, 0.1)):
+            with self.assertRaises(requests.Timeout):
+                canvas_client.send_inbox_message(self.canvas.base_url, TOKEN, "1", "Subject", "Body")
+
+
+def messages(count, body="Body"):
+    return [{"recipient_id": str(i), "subject": "Subject", "body": body} for i in range(count)]
+
+
+class SenderTests(FakeCanvasMixin, SimpleTestCase):
+    canvas_options = {"courses": 1, "students": 3, "rate_limit": 4.0, "refill_rate": 10.0}
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(sender, "BACKOFF", 0.05)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scripted(self, *results):
+        """A send() that answers with each result in turn."""
+        results = iter(results)
+        return lambda: dict(next(results))
+
+    def test_rate_limited_sends_are_retried(self):
+        # Four tokens refilled at ten a second: six quick sends overdraw the bucket
+        with mock.patch.object(sender, "MAX_RETRIES", 10):
+            results = sender.send_messages(self.canvas.base_url, TOKEN, messages(6), max_workers=4)
+
+        self.assertTrue(all(r["success"] for r in results))
+        self.assertEqual(self.canvas.sent, 6)
+        self.assertTrue(any(r["attempts"] > 1 for r in results))
+        self.assertGreater(self.canvas.calls["conversations"], 6)
+
+    def test_retry_after_and_server_errors(self):
+        gate = sender.AdaptiveLimit(8)
+        send = self.scripted(
+            {"success": False, "status_code": 429, "retry_after": 0.3},
+            {"success": False, "status_code": 502},
+            {"success": True, "status_code": 201},
+        )
+        with mock.patch.object(sender.time, "sleep") as sleep:
+            result = sender._send_with_retry(gate, send)
+
+        self.assertTrue(result["success"])
+        self.assertEqual(result["attempts"], 3)
+        first, second = (call.args[0] for call in sleep.call_args_list)
+        self.assertTrue(0.3 <= first < 0.3 + sender.BACKOFF / 2)
+        self.assertTrue(sender.BACKOFF * 2 <= second < sender.BACKOFF * 2.5)
+        # Only the throttled answer shrinks the gate
+        self.assertEqual(gate.limit, 4)
+
+    def test_other_errors_are_not_retried(self):
+        send = self.scripted({"success": False, "status_code": 403, "error": "403: user not authorized"})
+        result = sender._send_with_retry(sender.AdaptiveLimit(8), send)
+        self.assertEqual(result["attempts"], 1)
+
+    def test_gives_up_after_max_retries(self):
+        send = self.scripted(*[{"success": False, "status_code": 503}] * (sender.MAX_RETRIES + 1))
+        with mock.patch.object(sender.time, "sleep"):
+            result = sender._send_with_retry(sender.AdaptiveLimit(8), send)
+        self.assertFalse(result["success"])
+        self.assertEqual(result["attempts"], sender.MAX_RETRIES + 1)
+
+    def test_adaptive_limit_shrinks_and_grows(self):
+        gate = sender.AdaptiveLimit(8)
+        gate.observe(sender.LOW_WATER - 1)
+        self.assertEqual(gate.limit, 4)
+        gate.observe(None)
+        gate.observe(sender.LOW_WATER + 1)
+        self.assertEqual(gate.limit, 4)
+        for _ in range(10):
+            gate.observe(sender.HIGH_WATER + 1)
+        self.assertEqual(gate.limit, 8)
+
+        # Costly requests raise the marks past the fixed ones: at 8 in
+        # flight and cost 50 the low mark is 800, at 4 the high one is 1000
+        gate.observe(sender.HIGH_WATER + 1, cost=50)
+        self.assertEqual(gate.limit, 4)
+        gate.observe(1000, cost=50)
+        self.assertEqual(gate.limit, 4)
+        gate.observe(1001, cost=50)
+        self.assertEqual(gate.limit, 5)
+
+    def test_identical_messages_share_one_bulk_post(self):
+        results = sender.send_messages(self.canvas.base_url, TOKEN, messages(3), bulk=True)
+
+        self.assertEqual(self.canvas.calls["conversations"], 1)
+        self.assertEqual(self.canvas.sent, 3)
+        self.assertEqual([r["bulk_size"] for r in results], [3, 3, 3])
+
+    def test_failed_bulk_post_falls_back_to_individual_sends(self):
+        rejected = {"success": False, "status_code": 400, "error": "400: bulk_message not allowed"}
+        with mock.patch.object(canvas_client, "send_bulk_inbox_message", return_value=rejected):
+            results = sender.send_messages(self.canvas.base_url, TOKEN, messages(3), bulk=True)
+
+        self.assertTrue(all(r["success"] and "bulk_size" not in r for r in results))
+        self.assertEqual(self.canvas.calls["conversations"], 3)
+        self.assertEqual(self.canvas.sent, 3)
+
+
+class ReportQueryTests(SimpleTestCase):
+    data = {
+        "courses": [
+            {"id": 1, "students": [[11, "Cy", "CM"], [12, "ada", "CC"], [13, "Bea", "MM"]]},
+            {"id": 2, "students": [[21, "Adam", "M"]]},
+        ]
+    }
+
+    def ids(self, **params):
+        return [row[1] for row in report_query.matching_rows(self.data, report_query.parse_filters(params))]
+
+    def test_parse_filters(self):
+        self.assertEqual(
+            report_query.parse_filters({"q": " ad ", "only_missing": "on", "sort": "bogus"}),
+            {"q": "ad", "course": "", "only_missing": True, "sort": report_query.DEFAULT_SORT},
+        )
+
+    def test_filters(self):
+        self.assertEqual(self.ids(), [11, 12, 13, 21])
+        self.assertEqual(self.ids(q="AD"), [12, 21])
+        self.assertEqual(self.ids(course="1", only_missing="1"), [11, 13])
+
+    def test_sorts(self):
+        self.assertEqual(self.ids(sort="name"), [12, 21, 13, 11])
+        self.assertEqual(self.ids(sort="missing"), [13, 21, 11, 12])
+
+
+class CompiledTemplateTests(SimpleTestCase):
+    values = {"name": "Ada Lövelace", "missing_list": "- Essay (due Friday)\n- Quiz", "width": 15}
+
+    def test_matches_str_format(self):
+        templates = [
+            "",
+            "No placeholders at all",
+            "Hi {name},\n\nStill to do:\n{missing_list}\n",
+            "{name}{name}",
+            "{{literal braces}} around {name}",
+            "{name!r} {name!s} {name!a}",
+            "[{name:>20}] [{name:.3}] [{name:*^16}]",
+            "{name.upper}",
+            "{name[0]}",
+            "{name:>{width}}",
+        ]
+        for source in templates:
+            with self.subTest(source=source):
+                self.assertEqual(CompiledTemplate(source).render(**self.values), source.format(**self.values))
+
+    def test_errors_match_str_format(self):
+        for source in ["{unknown}", "{name!x}", "{name", "}"]:
+            with self.subTest(source=source):
+                with self.assertRaises(Exception) as expected:
+                    source.format(**self.values)
+                with self.assertRaises(type(expected.exception)):
+                    CompiledTemplate(source).render(**self.values)
+
+
+class SendJobTests(FakeCanvasMixin, TransactionTestCase):
+    week = "2026-02-01 00:00/2026-02-08 00:00"
+
+    def items(self, count):
+        return [
+            {
+                "course_id": "1001",
+                "course_name": "Course 1001",
+                "student_id": str(i),
+                "student_name": f"Student {i}",
+                "subject": "Subject",
+                "body": f"Body {i}",
+            }
+            for i in range(count)
+        ]
+
+    def crash_mid_send(self, job_id, heartbeat_age=0):
+        """Leave job_id as a process would that claimed every row and then stopped beating."""
+        SendJob.objects.filter(pk=job_id).update(
+            status=SendJob.RUNNING, heartbeat_at=timezone.now() - timedelta(seconds=heartbeat_age)
+        )
+        jobs._claim(job_id, list(SendJobMessage.objects.filter(job_id=job_id)))
+
+    def test_resume_skips_rows_the_journal_marks_sent(self):
+        job_id = jobs.submit_send_job(self.canvas.base_url, TOKEN, self.items(6), self.week, start=False)
+        SendJob.objects.filter(pk=job_id).update(status=SendJob.DONE, heartbeat_at=None)
+        keys = [jobs.idempotency_key("1001", str(i), self.week, f"Body {i}") for i in range(6)]
+        SendJournalEntry.objects.filter(idempotency_key__in=keys[:2]).update(status=SendJournalEntry.SENT)
+
+        self.assertTrue(jobs.resume_send_job(job_id, self.canvas.base_url, TOKEN, start=False))
+        jobs.run_send_job(job_id, self.canvas.base_url, TOKEN)
+
+        self.assertEqual(self.canvas.sent, 4)
+        progress = jobs.job_progress(job_id)
+        self.assertEqual((progress["sent"], progress["failed"]), (6, 0))
+        self.assertFalse(progress["resumable"])
+
+    def test_status_poll_leaves_out_message_bodies(self):
+        job_id = jobs.submit_send_job(self.canvas.base_url, TOKEN, self.items(3), self.week, start=False)
+        jobs.run_send_job(job_id, self.canvas.base_url, TOKEN)
+
+        progress = self.client.get(reverse("send_job_status", args=[job_id])).json()
+        self.assertEqual(progress["sent"], 3)
+        self.assertEqual(progress["messages"][0], {"position": 0, "status": SendJobMessage.SENT, "error": None})
+        self.assertEqual(jobs.job_progress(job_id, full=True)["messages"][0]["message_body"], "Body 0")
+
+    def test_second_job_does_not_resend(self):
+        first = jobs.submit_send_job(self.canvas.base_url, TOKEN, self.items(3), self.week, start=False)
+        second = jobs.submit_send_job(self.canvas.base_url, TOKEN, self.items(3), self.week, start=False)
+        jobs.run_send_job(first, self.canvas.base_url, TOKEN)
+        jobs.run_send_job(second, self.canvas.base_url, TOKEN)
+
+        self.assertEqual(self.canvas.sent, 3)
+        self.assertEqual(jobs.job_progress(second)["sent"], 3)
+
+    def test_resume_leaves_a_job_alive_elsewhere_alone(self):
+        job_id = jobs.submit_send_job(self.canvas.base_url, TOKEN, self.items(20), self.week, start=False)
+        self.crash_mid_send(job_id)
+
+        self.assertFalse(jobs.resume_send_job(job_id, self.canvas.base_url, TOKEN, start=False))
+        self.assertFalse(jobs.job_progress(job_id)["resumable"])
+        self.assertEqual(SendJournalEntry.objects.filter(status=SendJournalEntry.SENDING).count(), 20)
+
+        # Once the lease has run out the job is dead and its claims come back
+        SendJob.objects.filter(pk=job_id).update(heartbeat_at=timezone.now() - timedelta(seconds=jobs.LEASE + 1))
+        self.assertTrue(jobs.job_progress(job_id)["resumable"])
+        self.assertTrue(jobs.resume_send_job(job_id, self.canvas.base_url, TOKEN, start=False))
+        jobs.run_send_job(job_id, self.canvas.base_url, TOKEN)
+        self.assertEqual(self.canvas.sent, 20)
+
+    def test_claims_of_a_dead_job_are_taken_over(self):
+        live = jobs.submit_send_job(self.canvas.base_url, TOKEN, self.items(3), self.week, start=False)
+        self.crash_mid_send(live)
+        blocked = jobs.submit_send_job(self.canvas.base_url, TOKEN, self.items(3), self.week, start=False)
+        jobs.run_send_job(blocked, self.canvas.base_url, TOKEN)
+        self.assertEqual(self.canvas.sent, 0)
+        self.assertEqual(jobs.job_progress(blocked)["failed"], 3)
+
+        SendJob.objects.filter(pk=live).update(heartbeat_at=timezone.now() - timedelta(seconds=jobs.LEASE + 1))
+        self.assertTrue(jobs.resume_send_job(blocked, self.canvas.base_url, TOKEN, start=False))
+        jobs.run_send_job(blocked, self.canvas.base_url, TOKEN)
+        self.assertEqual(self.canvas.sent, 3)
+        self.assertEqual(jobs.job_progress(blocked)["sent"], 3)
+
+
+class NudgeCommandTests(FakeCanvasMixin, TransactionTestCase):
+    canvas_options = {"courses": 2, "students": 15, "assignments": 6}
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.output = Path(tmp.name) / "report.json"
+
+        sample = json.loads((Path(defaults.__file__).parent / "defaults.sample.json").read_text())
+        store = defaults.DefaultsStore(Path(tmp.name) / "defaults.json")
+        store.save(dict(
+            sample,
+            canvas_api_url=self.canvas.base_url,
+            api_token=TOKEN,
+            course_ids_raw=",".join(self.canvas.course_ids),
+        ))
+        for patcher in (
+            mock.patch.object(defaults, "_store", store),
+            mock.patch.dict(workflow._templates_cache, {"version": None}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def nudge(self, *args):
+        out = StringIO()
+        call_command(
+            "nudge",
+            "--start", self.canvas.start_date.strftime("%Y-%m-%d %H:%M"),
+            "--end", self.canvas.end_date.strftime("%Y-%m-%d %H:%M"),
+            "--output", str(self.output),
+            *args,
+            stdout=out,
+            stderr=StringIO(),
+        )
+        return out.getvalue(), json.loads(self.output.read_text())
+
+    def test_writes_the_report_without_sending(self):
+        _, written = self.nudge()
+
+        self.assertEqual(len(written["report"]["courses"]), 2)
+        missing = sum(c["summary"]["missing"] for c in written["report"]["courses"])
+        self.assertTrue(0 < len(written["messages"]) == missing)
+        self.assertIsNone(written["send_job"])
+        self.assertEqual(self.canvas.sent, 0)
+
+    def test_dry_run_sends_nothing(self):
+        out, written = self.nudge("--send", "--dry-run")
+        self.assertIn(f'Dry run: would send {len(written["messages"])} message(s)', out)
+        self.assertEqual(self.canvas.sent, 0)
+
+    def test_rerun_skips_students_already_messaged(self):
+        out, written = self.nudge("--send")
+        count = len(written["messages"])
+        self.assertIn(f"Sent {count}, failed 0 of {count}", out)
+        self.assertEqual(written["send_job"]["sent"], count)
+        self.assertEqual(self.canvas.sent, count)
+
+        self.nudge("--send", "--include-completed")
+        self.assertEqual(self.canvas.sent, 30)
+
+    def test_resume_of_an_unknown_job_fails(self):
+        with self.assertRaises(CommandError):
+            self.nudge("--resume", "999")
+
+
+class ReportViewMixin(FakeCanvasMixin):
+    """A signed-in session with every FakeCanvas course selected, and throwaway stores."""
+
+    def setUp(self):
+        super().setUp()
+        caches = override_settings(CACHES=TEST_CACHES)
+        caches.enable()
+        self.addCleanup(caches.disable)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(defaults, "_store", defaults.DefaultsStore(Path(tmp.name) / "defaults.json"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        courses = canvas_client.get_courses_by_ids(self.canvas.base_url, TOKEN, self.canvas.course_ids)
+        session = self.client.session
+        session.update({
+            "api_token": TOKEN,
+            "canvas_api_url": self.canvas.base_url,
+            "courses": courses,
+            "selected_course_ids": self.canvas.course_ids,
+            "start_date": self.canvas.start_date.isoformat(),
+            "end_date": self.canvas.end_date.isoformat(),
+        })
+        session.save()
+
+    def stored_report(self):
+        return report_store.load(self.client.session["weekly_report_id"])
+
+
+class WeeklyReportStreamTests(ReportViewMixin, TestCase):
+    canvas_options = {"courses": 2, "students": 60, "assignments": 4}
+
+    def test_card_form_works_while_the_rest_streams(self):
+        response = self.client.get(reverse("weekly_report"))
+        self.assertFalse(response.is_async)
+        chunks = iter(response.streaming_content)
+        next(chunks)  # page head
+        card = next(chunks).decode()
+        course_id = re.search(r'name="course" value="(\d+)"', card).group(1)
+
+        preview = self.client.post(reverse("messages_preview"), {"select_matching": "1", "course": course_id})
+        self.assertEqual(preview.status_code, 200)
+        self.assertEqual(preview.content.count(b'name="message_'), 60)
+        response.close()
+
+    def test_failed_course_gets_an_error_card(self):
+        broken = self.canvas.course_ids[0]
+        get_students = canvas_client.get_students
+
+        def flaky(base_url, course_id, token):
+            if str(course_id) == broken:
+                raise requests.HTTPError("500 Server Error")
+            return get_students(base_url, course_id, token)
+
+        with mock.patch.object(canvas_client, "get_students", flaky):
+            body = b"".join(self.client.get(reverse("weekly_report")).streaming_content).decode()
+
+        self.assertIn("could not be loaded from Canvas: 500 Server Error", body)
+        self.assertEqual(body.count('class="course-card"'), 2)
+        self.assertEqual([str(c["id"]) for c in self.stored_report()["courses"]], [self.canvas.course_ids[1]])
+
+    async def test_streams_asynchronously_under_asgi(self):
+        self.async_client.cookies = self.client.cookies
+        response = await self.async_client.get(reverse("weekly_report"))
+        self.assertTrue(response.is_async)
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(body.count('class="course-card"'), 2)
+
+    async def test_reports_are_built_off_the_event_loop(self):
+        self.async_client.cookies = self.client.cookies
+        build = WeeklyReportView._build
+        on_loop = []
+
+        def spy(*args):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return build(*args)
+
+        with mock.patch.object(WeeklyReportView, "_build", staticmethod(spy)):
+            response = await self.async_client.get(reverse("weekly_report"))
+            b"".join([chunk async for chunk in response.streaming_content])
+            await self.async_client.get(reverse("weekly_report") + "?stream=0")
+
+        self.assertEqual(on_loop, [False, False, False])
+
+
+class ReportSelectionTests(ReportViewMixin, TestCase):
+    canvas_options = {"courses": 2, "students": 70, "assignments": 6}
+
+    def setUp(self):
+        super().setUp()
+        self.client.get(reverse("weekly_report") + "?stream=0")
+        self.report = self.stored_report()
+
+    def preview_count(self, data):
+        response = self.client.post(reverse("messages_preview"), data)
+        self.assertEqual(response.status_code, 200)
+        return response.content.count(b'name="message_')
+
+    def test_browse_pages_through_matching_students(self):
+        response = self.client.get(reverse("weekly_report_browse"), {"sort": "name", "page": 2})
+        self.assertEqual(response.context["page"].paginator.count, 140)
+        self.assertEqual(len(response.context["rows"]), report_query.PAGE_SIZE)
+        names = [row.name for _, row in response.context["rows"]]
+        self.assertEqual(names, sorted(names, key=str.lower))
+
+    def test_select_matching_covers_students_off_the_page(self):
+        course = self.report["courses"][1]
+        missing = [sid for sid, _, codes in course["students"] if "M" in codes]
+        self.assertTrue(0 < len(missing) < 70)
+
+        self.assertEqual(self.preview_count({"select_matching": "1", "course": course["id"]}), 70)
+        self.assertEqual(
+            self.preview_count({"select_matching": "1", "course": course["id"], "only_missing": "1"}),
+            len(missing),
+        )
+
+    def test_ticked_students_are_not_repeated_and_unknown_ones_are_dropped(self):
+        course = self.report["courses"][0]
+        sid = course["students"][0][0]
+        data = {
+            "select_matching": "1",
+            "course": course["id"],
+            "selected_student_ids": [f'{course["id"]}:{sid}', f'{self.report["courses"][1]["id"]}:1'],
+        }
+        self.assertEqual(self.preview_count(data), 70)
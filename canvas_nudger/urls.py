@@ -5,7 +5,12 @@ urlpatterns = [
     path('', views.StartView.as_view(), name='start'),
     path('courses/confirm/', views.ConfirmCoursesView.as_view(), name='courses_confirm'),
     path('report/', views.WeeklyReportView.as_view(), name='weekly_report'),
+    path('report/browse/', views.WeeklyReportBrowseView.as_view(), name='weekly_report_browse'),
+    path('report/refresh/', views.RefreshReportView.as_view(), name='refresh_report'),
     path('messages/preview/', views.MessagePreviewView.as_view(), name='messages_preview'),
     path('messages/send/', views.SendMessagesView.as_view(), name='messages_send'),
+    path('messages/send/<int:job_id>/status/', views.SendJobStatusView.as_view(), name='send_job_status'),
+    path('messages/send/<int:job_id>/resume/', views.ResumeSendJobView.as_view(), name='send_job_resume'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
     path('templates/', views.MessageTemplateView.as_view(), name='message_templates'),
 ]
@@ -1,11 +1,17 @@
 from typing import Dict, Any
 from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import render
-from django.views.generic import FormView, TemplateView
-from django.urls import reverse_lazy
-from .workflow import get_last_week_range, build_weekly_status, generate_message
+from django.template.loader import get_template
+from django.views.generic import FormView, TemplateView, View
+from django.urls import reverse, reverse_lazy
+from .workflow import MESSAGE_SUBJECTS, get_last_week_range, build_weekly_status, generate_messages
 from .forms import StartForm, ConfirmCoursesForm, MessageTemplateForm
-from . import canvas_client
+from . import canvas_client, columnar, jobs, metrics, records, report_query, report_store
 from .defaults import load_defaults, get_message_templates, save_message_templates, update_defaults
 
 
@@ -53,124 +59,317 @@ class ConfirmCoursesView(FormView):
     form_class = ConfirmCoursesForm
     success_url = reverse_lazy("weekly_report") 
     
-    def get_form_kwargs(self):
-        kwargs = super().get_form_kwargs()
-        token = self.request.session.get("api_token")
-        course_ids = self.request.session.get("course_ids", [])
-        base_url = self.request.session.get("canvas_api_url")
+    courses = None
+
+    async def _load_courses(self, refresh):
+        session = self.request.session
+        courses = None if refresh else await session.aget("courses")
+
+        if courses is None:
+            token = await session.aget("api_token")
+            course_ids = await session.aget("course_ids", [])
+            base_url = await session.aget("canvas_api_url")
+
+            # Fetch course metadata
+            courses = await canvas_client.aget_courses_by_ids(base_url, token, course_ids)
+
+            # Store raw course data in session
+            await session.aset("courses", courses)
+
+        self.courses = courses
+
+    async def get(self, request, *args, **kwargs):
+        await self._load_courses(refresh=True)
+        return self.render_to_response(self.get_context_data())
 
-        # Fetch course metadata
-        courses = canvas_client.get_courses_by_ids(base_url, token, course_ids)
+    async def post(self, request, *args, **kwargs):
+        # Reuse the courses fetched for the GET instead of asking Canvas again
+        await self._load_courses(refresh=False)
+        form = self.get_form()
+        if not form.is_valid():
+            return self.form_invalid(form)
 
-        # Store raw course data in session
-        self.request.session["courses"] = courses
+        selected = form.cleaned_data["courses"]
+        await request.session.aset("selected_course_ids", selected)
+        return HttpResponseRedirect(self.get_success_url())
+
+    async def put(self, *args, **kwargs):
+        return await self.post(*args, **kwargs)
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        courses = self.courses or []
 
         # Build choices
         choices = [(str(c["id"]), f'{c["name"]} ({c["course_code"]})') for c in courses]
 
-        # ADD THIS
         kwargs["course_choices"] = choices
         kwargs["courses_data"] = {str(c["id"]): c for c in courses}
 
         return kwargs
-    
-    def form_valid(self, form):
-        selected = form.cleaned_data["courses"] 
-        self.request.session["selected_course_ids"] = selected
-        return super().form_valid(form)
 
 
 class WeeklyReportView(TemplateView):
     template_name = "canvas_nudger/weekly_report.html"
 
-    def get(self, request, *args, **kwargs):
-        token = request.session.get("api_token")
-        selected_ids = request.session.get("selected_course_ids", [])
-        courses = request.session.get("courses", [])
-        base_url = self.request.session.get("canvas_api_url")
+    # Streaming mode sends the page head at once and then one course card
+    # per course as soon as it is fetched and classified. ?stream=0 falls
+    # back to rendering the whole page at the end.
+    stream = True
+    head_template_name = "canvas_nudger/weekly_report_head.html"
+    course_template_name = "canvas_nudger/weekly_report_course.html"
+    course_error_template_name = "canvas_nudger/weekly_report_course_error.html"
+    foot_template_name = "canvas_nudger/weekly_report_foot.html"
+
+    # Students shown per course card; the rest are a click away in
+    # WeeklyReportBrowseView
+    card_rows = 50
+
+    async def get(self, request, *args, **kwargs):
+        session = request.session
+        token = await session.aget("api_token")
+        selected_ids = await session.aget("selected_course_ids", [])
+        courses = await session.aget("courses", [])
+        base_url = await session.aget("canvas_api_url")
 
         # Filter only selected courses
         selected_courses = [c for c in courses if str(c["id"]) in selected_ids]
 
-        start_raw = request.session.get("start_date")
-        end_raw = request.session.get("end_date")
+        start_raw = await session.aget("start_date")
+        end_raw = await session.aget("end_date")
         if start_raw and end_raw:
             start = datetime.fromisoformat(start_raw)
             end = datetime.fromisoformat(end_raw)
         else:
             start, end = get_last_week_range()
 
-        students_map = {}
-        assignments_map = {}
-        submissions_map = {}
+        canvas_base_url = str(base_url).split('/api')[0] or None
+
+        # The session is saved before a streamed body is sent, so the
+        # report ID has to be assigned up front
+        await report_store.adelete(await session.aget("weekly_report_id"))
+        report_id = report_store.new_id()
+        await session.aset("weekly_report_id", report_id)
+
+        if self.stream and request.GET.get("stream") != "0":
+            # Make sure the CSRF cookie goes out with the headers
+            get_token(request)
+            # Django only streams an async iterator under ASGI and a sync one
+            # under WSGI; given the other kind it buffers the whole page
+            stream = self._astream if isinstance(request, ASGIRequest) else self._stream
+            # The body is built after MetricsMiddleware returns, so hand its
+            # collector over for the footer
+            collector = metrics.current()
+            return StreamingHttpResponse(
+                stream(base_url, token, selected_courses, start, end, canvas_base_url, report_id, collector),
+                content_type="text/html; charset=utf-8",
+            )
+
+        # Fetch students, assignments and submissions for all courses in parallel
+        with metrics.stage("fetch_course_data"):
+            students_map, assignments_map, submissions_map = await canvas_client.afetch_course_data(
+                base_url, token, selected_courses, start, end
+            )
 
-        for course in selected_courses:
-            cid = str(course["id"])
+        # Classifying a large cohort is CPU-bound; keep it off the event loop
+        # like the Canvas calls, so other requests on this worker carry on
+        weekly_report, data = await sync_to_async(self._build_report, thread_sensitive=False)(
+            selected_courses, students_map, assignments_map, submissions_map
+        )
+        weekly_report["canvas_base_url"] = canvas_base_url
 
-            # Fetch students
-            students = canvas_client.get_students(base_url, cid, token)
-            students_map[cid] = students
+        # Store a compact copy for the next step; the session keeps only its ID
+        await report_store.asave(data, report_id)
 
-            # Fetch assignments due last week
-            assignments_raw = canvas_client.get_assignments(base_url, cid, token)
-            assignments = canvas_client.filter_assignments_by_date(assignments_raw, start, end)
-            assignments_map[cid] = assignments
+        return self.render_to_response({
+            "weekly_report": weekly_report,
+            "request_metrics": self._metrics_footer(metrics.current()),
+        })
 
-            # Fetch submissions for those assignments
-            assignment_ids = [a["id"] for a in assignments]
-            submissions = canvas_client.get_submissions(base_url, cid, assignment_ids, token)
+    @staticmethod
+    def _build(courses, students_map, assignments_map, submissions_map):
+        # Build the weekly report structure (NumPy engine for very large cohorts)
+        if columnar.should_use(students_map, assignments_map):
+            build = columnar.build_weekly_status_columnar
+        else:
+            build = build_weekly_status
+        return build(courses, students_map, assignments_map, submissions_map)
+
+    def _build_report(self, courses, students_map, assignments_map, submissions_map):
+        """The report and its compact stored form, with cards prepared."""
+        weekly_report: Dict[str, Any] = self._build(courses, students_map, assignments_map, submissions_map)
+        data = records.dump_report(weekly_report)
+        for course, dumped in zip(weekly_report["courses"], data["courses"]):
+            self._prepare_card(course, dumped)
+        return weekly_report, data
+
+    def _prepare_card(self, course, dumped):
+        course["summary"] = dumped["summary"]
+        course["shown"] = course["students"][:self.card_rows]
+
+    def _stream(self, base_url, token, courses, start, end, canvas_base_url, report_id, collector):
+        with metrics.collecting(collector):
+            yield get_template(self.head_template_name).render({}, self.request)
+
+            # The stored report grows with every card, so a card's form works
+            # as soon as it arrives, and a client that leaves early still
+            # leaves the courses it saw
+            dumped = {}
+            report_store.save(self._stored(courses, dumped, canvas_base_url), report_id)
+            for course, data, error in canvas_client.iter_course_data(base_url, token, courses, start, end):
+                card = self._render_card(course, data, error, dumped, canvas_base_url)
+                if error is None:
+                    report_store.save(self._stored(courses, dumped, canvas_base_url), report_id)
+                yield card
+
+            yield self._render_foot(collector)
+
+    async def _astream(self, base_url, token, courses, start, end, canvas_base_url, report_id, collector):
+        with metrics.collecting(collector):
+            yield get_template(self.head_template_name).render({}, self.request)
+
+            dumped = {}
+            await report_store.asave(self._stored(courses, dumped, canvas_base_url), report_id)
+            # Building and rendering a card is CPU-bound, so it runs on a
+            # worker thread like the fetches
+            render_card = sync_to_async(self._render_card, thread_sensitive=False)
+            async for course, data, error in canvas_client.aiter_course_data(base_url, token, courses, start, end):
+                card = await render_card(course, data, error, dumped, canvas_base_url)
+                if error is None:
+                    await report_store.asave(self._stored(courses, dumped, canvas_base_url), report_id)
+                yield card
+
+            yield self._render_foot(collector)
+
+    def _render_foot(self, collector):
+        return get_template(self.foot_template_name).render(
+            {"request_metrics": self._metrics_footer(collector)}, self.request
+        )
 
-            # Keep the raw dict: {assignment_id: [submissions]}
-            submissions_map[cid] = submissions
+    @staticmethod
+    def _metrics_footer(collector):
+        # X-Canvas-Metrics goes out before a streamed body is built, so in
+        # DEBUG the page itself carries the request's numbers
+        if collector is None or not settings.DEBUG:
+            return None
+        return dict(collector.totals(), stages=collector.snapshot()["stages"])
+
+    def _render_card(self, course, data, error, dumped, canvas_base_url):
+        """Build and render one streamed course card, recording its compact copy in dumped."""
+        if error is not None:
+            return get_template(self.course_error_template_name).render(
+                {"course": course, "error": error}, self.request
+            )
 
-        # Build the weekly report structure
-        weekly_report: Dict[str, Any] = build_weekly_status(
-            selected_courses,
-            students_map,
-            assignments_map,
-            submissions_map,
+        cid = str(course["id"])
+        students, assignments, submissions = data
+        course_report = self._build(
+            [course], {cid: students}, {cid: assignments}, {cid: submissions}
+        )["courses"][0]
+        dumped[cid] = records.dump_course(course_report)
+        self._prepare_card(course_report, dumped[cid])
+        return get_template(self.course_template_name).render(
+            {"course": course_report, "canvas_base_url": canvas_base_url}, self.request
         )
-        
-        weekly_report["canvas_base_url"] = str(request.session.get("canvas_api_url")).split('/api')[0] or None
 
-        # Store for next step
-        request.session["weekly_report"] = weekly_report
+    @staticmethod
+    def _stored(courses, dumped, canvas_base_url):
+        # Cards arrive fastest first; the stored copy keeps the selected
+        # order and leaves out courses that failed to load
+        return {
+            "courses": [dumped[str(c["id"])] for c in courses if str(c["id"]) in dumped],
+            "canvas_base_url": canvas_base_url,
+        }
+
 
-        return self.render_to_response({"weekly_report": weekly_report})
+class WeeklyReportBrowseView(TemplateView):
+    """Paged, filterable and sortable view of the stored weekly report."""
+
+    template_name = "canvas_nudger/weekly_report_browse.html"
+
+    def get(self, request, *args, **kwargs):
+        data = report_store.load(request.session.get("weekly_report_id"))
+        if data is None:
+            # Report expired or was never built
+            return HttpResponseRedirect(reverse("weekly_report"))
+
+        filters = report_query.parse_filters(request.GET)
+        page, rows = report_query.report_page(data, filters, request.GET.get("page"))
+
+        query = request.GET.copy()
+        query.pop("page", None)
+
+        return self.render_to_response({
+            "courses": data["courses"],
+            "filters": filters,
+            "page": page,
+            "rows": rows,
+            "querystring": query.urlencode(),
+            "canvas_base_url": data.get("canvas_base_url"),
+        })
+
+
+class RefreshReportView(View):
+    """Drop this user's cached Canvas data and rebuild the report."""
+
+    async def post(self, request):
+        token = await request.session.aget("api_token")
+        await sync_to_async(canvas_client.invalidate_cache)(token)
+        return HttpResponseRedirect(reverse("weekly_report"))
 
 
 class MessagePreviewView(TemplateView):
     template_name = "canvas_nudger/messages_preview.html"
 
     def post(self, request):
-        weekly_report = request.session.get("weekly_report")
+        stored = report_store.load(request.session.get("weekly_report_id"))
+        if stored is None:
+            # Report expired or was never built
+            return HttpResponseRedirect(reverse("weekly_report"))
+
+        weekly_report = records.load_report(stored)
         selected_ids = request.POST.getlist("selected_student_ids")
 
+        # "Select all matching" on the browse page sends its filters instead
+        # of one checkbox per student
+        if request.POST.get("select_matching"):
+            filters = report_query.parse_filters(request.POST)
+            for i, sid, _, _ in report_query.matching_rows(stored, filters):
+                selected_ids.append(f'{stored["courses"][i]["id"]}:{sid}')
+
+        # Look courses and students up by ID once instead of per selection
+        courses = {
+            str(c["id"]): (c, {str(s["id"]): s for s in reversed(c["students"])})
+            for c in weekly_report["courses"]
+        }
+
         # selected_ids look like: ["courseid:studentid", ...]
-        pending_messages = []
+        selected = []
+        seen = set()
 
         for pair in selected_ids:
+            if pair in seen:
+                continue
+            seen.add(pair)
             course_id, student_id = pair.split(":")
 
             # Find course
-            course = next(
-                (c for c in weekly_report["courses"] if str(c["id"]) == course_id),
-                None
-            )
+            course, students = courses.get(course_id, (None, None))
             if not course:
                 continue
 
             # Find student
-            student = next(
-                (s for s in course["students"] if str(s["id"]) == student_id),
-                None
-            )
+            student = students.get(student_id)
             if not student:
                 continue
 
-            # Generate message
-            msg = generate_message(student)
+            selected.append((course_id, course, student_id, student))
+
+        # Generate all messages in one batch
+        messages = generate_messages([student for _, _, _, student in selected])
 
+        pending_messages = []
+        for (course_id, course, student_id, student), msg in zip(selected, messages):
             pending_messages.append({
                 "course_id": course_id,
                 "course_name": course["name"],
@@ -181,22 +380,23 @@ class MessagePreviewView(TemplateView):
             })
 
         # Store for Step 5
-        request.session["pending_messages"] = pending_messages
+        report_store.delete(request.session.get("pending_messages_id"))
+        request.session["pending_messages_id"] = report_store.save(pending_messages)
 
         return render(request, self.template_name, {
             "messages": pending_messages
         })
 
 
-class SendMessagesView(TemplateView):
+class SendMessagesView(View):
     template_name = "canvas_nudger/messages_sent.html"
 
-    def post(self, request):
-        token = request.session.get("api_token")
-        pending = request.session.get("pending_messages", [])
-        base_url = self.request.session.get("canvas_api_url")
-
-        sent_report = []
+    async def post(self, request):
+        session = request.session
+        token = await session.aget("api_token")
+        pending_id = await session.aget("pending_messages_id")
+        pending = await report_store.aload(pending_id) or []
+        base_url = await session.aget("canvas_api_url")
 
         # Collect edited messages from the form
         edited_messages = {}
@@ -206,42 +406,81 @@ class SendMessagesView(TemplateView):
                 _, course_id, student_id = key.split("_", 2)
                 edited_messages[f"{course_id}:{student_id}"] = value
 
+        items = []
         for msg in pending:
             key = f"{msg['course_id']}:{msg['student_id']}"
             body = edited_messages.get(key, msg["message_body"])
 
-            # Canvas requires a subject — we can generate a simple one
-            subject = (
-                "Great work this week!"
-                if msg["message_type"] == "congrats"
-                else "A quick update on your assignments"
-            )
-
-            result = canvas_client.send_inbox_message(
-                base_url=base_url,
-                token=token,
-                recipient_id=msg["student_id"],
-                subject=subject,
-                body=body,
-            )
+            subject = MESSAGE_SUBJECTS.get(msg["message_type"], MESSAGE_SUBJECTS["encourage"])
 
-            sent_report.append({
+            items.append({
+                "course_id": msg["course_id"],
                 "course_name": msg["course_name"],
+                "student_id": msg["student_id"],
                 "student_name": msg["student_name"],
-                "message_body": body,
-                "status": "sent" if result["success"] else "failed",
-                "error": result.get("error"),
+                "subject": subject,
+                "body": body,
             })
 
-        # Store for display
-        request.session["sent_report"] = sent_report
+        # Hand the batch to a background job and return right away;
+        # the page polls SendJobStatusView for progress
+        week = f'{await session.aget("start_date")}/{await session.aget("end_date")}'
+        job_id = await sync_to_async(jobs.submit_send_job)(base_url, token, items, week)
+        await session.aset("send_job_id", job_id)
 
         # Clear pending messages
-        if "pending_messages" in request.session:
-            del request.session["pending_messages"]
-
+        await report_store.adelete(pending_id)
+        await session.apop("pending_messages_id", None)
+
+        return await self._render_job(request, job_id)
+
+    async def get(self, request):
+        # Reopen the progress page for the most recent job
+        job_id = await request.session.aget("send_job_id")
+        if job_id is None:
+            return HttpResponseRedirect(reverse("start"))
+        return await self._render_job(request, job_id)
+
+    async def _render_job(self, request, job_id):
+        progress = await sync_to_async(jobs.job_progress)(job_id, full=True)
+        if progress is None:
+            raise Http404("Send job not found")
         return render(request, self.template_name, {
-            "sent_report": sent_report
+            "job": progress,
+            "sent_report": progress["messages"],
+        })
+
+
+class ResumeSendJobView(View):
+    """Retry a job's failed or interrupted messages; delivered ones are skipped."""
+
+    async def post(self, request, job_id):
+        session = request.session
+        token = await session.aget("api_token")
+        base_url = await session.aget("canvas_api_url")
+
+        await sync_to_async(jobs.resume_send_job)(job_id, base_url, token)
+        await session.aset("send_job_id", job_id)
+        return HttpResponseRedirect(reverse("messages_send"))
+
+
+class SendJobStatusView(View):
+    """Lightweight JSON progress for a background send job."""
+
+    def get(self, request, job_id):
+        progress = jobs.job_progress(job_id)
+        if progress is None:
+            raise Http404("Send job not found")
+        return JsonResponse(progress)
+
+
+class MetricsView(View):
+    """Canvas call, cache and stage metrics for this process, as JSON."""
+
+    def get(self, request):
+        return JsonResponse({
+            **metrics.snapshot(),
+            "response_cache": canvas_client.cache_stats(),
         })
 
 
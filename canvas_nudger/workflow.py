@@ -1,6 +1,16 @@
 from datetime import datetime, timedelta
+from string import Formatter
+from threading import Lock
 from pytz import utc
-from .defaults import get_message_templates
+from . import metrics
+from .defaults import defaults_version, get_message_templates
+from .records import AssignmentRow, StudentRow
+
+# Canvas requires a subject; one per message type
+MESSAGE_SUBJECTS = {
+    "congrats": "Great work this week!",
+    "encourage": "A quick update on your assignments",
+}
 
 def get_last_week_range():
     today = datetime.now()
@@ -9,23 +19,60 @@ def get_last_week_range():
     return start, end
 
 
-def _is_assignment_expired(assignment):
+def _is_assignment_expired(assignment, now=None):
     """Check if an assignment's lock_at date has passed."""
     lock_at = assignment.get("lock_at")
     if not lock_at:
         return False
 
+    if "lock_ts" in assignment:
+        # Parsed once at ingest
+        if assignment["lock_ts"] is None:
+            return False
+        if now is None:
+            now = datetime.now(utc)
+        return now.timestamp() > assignment["lock_ts"]
+
     try:
         lock_dt = datetime.fromisoformat(lock_at.replace("Z", "+00:00"))
         # Ensure UTC timezone for comparison
         if lock_dt.tzinfo is None:
             lock_dt = utc.localize(lock_dt)
-        now = datetime.now(utc)
+        if now is None:
+            now = datetime.now(utc)
         return now > lock_dt
     except (ValueError, TypeError):
         return False
 
 
+def _index_submissions(course_submissions):
+    """Map (assignment_id, user_id) -> the first submission for that pair."""
+    index = {}
+    for aid, subs in course_submissions.items():
+        for s in subs:
+            index.setdefault((aid, str(s.get("user_id"))), s)
+    return index
+
+
+def _is_submitted(sub):
+    # Rule: submitted if:
+    #   - submission exists with submitted_at present, OR
+    #   - score > 0, OR
+    #   - excused
+    # Rule: missing if:
+    #   - NOT any of the above
+    if not sub:
+        return False
+
+    score = sub.get("score")
+    return bool(
+        sub.get("submitted_at")  # has submission with submitted_at
+        or (score is not None and score > 0)  # score > 0
+        or sub.get("excused", False)  # excused
+    )
+
+
+@metrics.timed("build_weekly_status")
 def build_weekly_status(courses, students_map, assignments_map, submissions_map):
     """
     courses: list of course dicts
@@ -35,79 +82,132 @@ def build_weekly_status(courses, students_map, assignments_map, submissions_map)
     """
 
     report = {"courses": []}
+    now = datetime.now(utc)
 
     for course in courses:
         cid = str(course["id"])
         course_students = students_map[cid]
         course_assignments = assignments_map[cid]
-        course_submissions = submissions_map[cid]
+
+        # Built once per course: compact assignment rows, submission lookup
+        # and expiry per assignment
+        rows = [AssignmentRow.from_canvas(a) for a in course_assignments]
+        index = _index_submissions(submissions_map[cid])
+        table = [
+            (row, str(assignment["id"]), _is_assignment_expired(assignment, now))
+            for row, assignment in zip(rows, course_assignments)
+        ]
 
         student_statuses = []
 
         for student in course_students:
             sid = student["id"]
+            sid_key = str(sid)
 
             completed = []
             missing = []
             expired = []
 
-            for assignment in course_assignments:
-                aid = str(assignment["id"])
-                subs = course_submissions.get(aid, [])
-
-                # Find this student's submission
-                sub = next((s for s in subs if str(s.get("user_id")) == str(sid)), None)
-
-                # Rule: submitted if:
-                #   - submission exists with submitted_at present, OR
-                #   - score > 0, OR
-                #   - excused
-                # Rule: missing if:
-                #   - NOT any of the above
-
-                has_submitted_at = sub and sub.get("submitted_at")
-                score = sub.get("score") if sub else None
-                excused = sub.get("excused", False) if sub else False
-
-                is_submitted = (
-                    has_submitted_at  # has submission with submitted_at
-                    or (score is not None and score > 0)  # score > 0
-                    or excused  # excused
-                )
-
-                if is_submitted:
+            for assignment, aid, is_expired in table:
+                if _is_submitted(index.get((aid, sid_key))):
                     completed.append(assignment)
+                elif is_expired:
+                    # Not submitted and the assignment is locked
+                    expired.append(assignment)
                 else:
-                    # Not submitted. Check if assignment is expired.
-                    if _is_assignment_expired(assignment):
-                        expired.append(assignment)
-                    else:
-                        missing.append(assignment)
-
-            student_statuses.append({
-                "id": sid,
-                "name": student.get("name"),
-                "completed_all": len(missing) == 0,
-                "completed_assignments": completed,
-                "missing_assignments": missing,
-                "expired_assignments": expired,
-            })
+                    missing.append(assignment)
+
+            student_statuses.append(
+                StudentRow(sid, student.get("name"), completed, missing, expired)
+            )
 
         report["courses"].append({
             "id": cid,
             "name": course["name"],
+            "assignments": rows,
             "students": student_statuses,
         })
 
     return report
 
 
-def generate_message(student_status):
-    templates = get_message_templates()
+class CompiledTemplate:
+    """
+    A message template parsed once, rendering exactly like str.format for
+    plain {field} / {field!r} / {field:spec} placeholders. Anything more
+    exotic (positional, attribute or nested fields) falls back to str.format.
+    """
+
+    __slots__ = ("source", "parts")
+
+    def __init__(self, source):
+        self.source = source
+        self.parts = []
+        try:
+            for literal, field, spec, conversion in Formatter().parse(source):
+                if field is not None and (
+                    not field
+                    or field.isdigit()
+                    or "." in field
+                    or "[" in field
+                    or "{" in (spec or "")
+                    or conversion not in (None, "r", "s", "a")
+                ):
+                    self.parts = None
+                    break
+                self.parts.append((literal, field, spec, conversion))
+        except ValueError:
+            # Malformed template; let str.format raise the usual error on render
+            self.parts = None
+
+    def render(self, **values):
+        if self.parts is None:
+            return self.source.format(**values)
+
+        out = []
+        for literal, field, spec, conversion in self.parts:
+            out.append(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if conversion == "r":
+                value = repr(value)
+            elif conversion == "a":
+                value = ascii(value)
+            elif conversion == "s":
+                value = str(value)
+            out.append(format(value, spec))
+        return "".join(out)
+
+
+_templates_cache = {"version": None, "templates": None}
+_templates_lock = Lock()
+
+
+def get_compiled_templates():
+    """
+    Compiled congrats/encourage templates. defaults.json is only re-read
+    when its mtime/size changes or save_defaults has run since.
+    """
+    version = defaults_version()
+    if _templates_cache["version"] != version:
+        with _templates_lock:
+            if _templates_cache["version"] != version:
+                templates = get_message_templates()
+                _templates_cache["templates"] = {
+                    key: CompiledTemplate(source) for key, source in templates.items()
+                }
+                _templates_cache["version"] = version
+    return _templates_cache["templates"]
+
+
+def generate_message(student_status, templates=None):
+    if templates is None:
+        templates = get_compiled_templates()
     name = student_status["name"]
 
     if student_status["completed_all"]:
-        body = templates["congrats"].format(name=name)
+        body = templates["congrats"].render(name=name)
         return {
             "message_type": "congrats",
             "message_body": body,
@@ -128,7 +228,7 @@ def generate_message(student_status):
 
     missing_list = "\n".join(missing_lines)
 
-    body = templates["encourage"].format(
+    body = templates["encourage"].render(
         name=name,
         missing_list=missing_list
     )
@@ -137,3 +237,10 @@ def generate_message(student_status):
         "message_type": "encourage",
         "message_body": body,
     }
+
+
+@metrics.timed("generate_messages")
+def generate_messages(student_statuses):
+    """Render messages for many students with one template lookup."""
+    templates = get_compiled_templates()
+    return [generate_message(status, templates) for status in student_statuses]